@@ -4,110 +4,1193 @@
 # In[32]:
 
 
-import tkinter as tk
-from tkinter import messagebox, ttk
+# tkinter is imported inside the window code only, so the API, imports and cron exports run on Pythons built without Tk
 import pickle
+from array import array
+import sqlite3
+import threading
+import multiprocessing
+import zlib
 import os
+import time
+import random
+import argparse
+import csv
+import itertools
+import collections
+from contextlib import contextmanager
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import hashlib
+import hmac
+import bisect
+import tracemalloc
+import functools
+import json
+import cProfile
+import pstats
+import struct
+import mmap
+import sys
+import signal
+import http.server
+import http.client
+import secrets
+import urllib.parse
+
+
+# Password Hashing
+# Stored as pbkdf2_sha256$iterations$salt$hash; accounts created before hashing hold plaintext until next login
+password_iterations = 100000  # Default PBKDF2 cost, see --benchmark-passwords to size it
+
+
+def hash_password(password, iterations=None):
+    iterations = iterations or password_iterations
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(stored, password):
+    if not stored.startswith("pbkdf2_sha256$"):
+        return hmac.compare_digest(stored.encode(), password.encode())
+    _, iterations, salt, digest = stored.split("$")
+    candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(candidate.hex(), digest)
+
+
+def needs_rehash(stored, iterations=None):
+    # Legacy plaintext, or a hash made with a different cost than the current setting
+    return not stored.startswith(f"pbkdf2_sha256${iterations or password_iterations}$")
 
 
 # User Class
 class User:
+    __slots__ = ("user_id", "name", "email", "password")  # No per-instance __dict__
+
     def __init__(self, user_id, name, email, password):
         self.user_id = user_id
         self.name = name
         self.email = email
-        self.password = password
-        self.bought_tickets = []  # Track bought tickets
+        self.password = password  # Salted hash, see hash_password
 
+    def __reduce__(self):
+        # Pickle as a constructor call: smaller and faster than a state dict
+        return (User, (self.user_id, self.name, self.email, self.password))
 
-# System Class
-class System:
+    def __setstate__(self, state):
+        # Files written before __slots__ hold a __dict__ state; bought_tickets now live in the TicketLedger
+        if isinstance(state, tuple):
+            state = state[1]
+        for field in User.__slots__:
+            setattr(self, field, state[field])
+
+
+# Ticket Ledger
+class TicketLedger:
+    # Purchased tickets stored column by column in typed arrays instead of a list per user
     def __init__(self):
-        self.users = []
-        self.admin_credentials = {"admin": "admin123"}  # Fixed admin credentials
-        self.ticket_sales = {}  # To track total tickets sold per day
-        self.discount_info = {}  # To store discount information
+        self.user_ids = array('q')
+        self.type_codes = array('H')  # Index into type_names
+        self.visit_days = array('l')  # datetime.date ordinals
+        self.num_people = array('l')
+        self.prices = array('d')
+        self.type_names = []
+        self.previous_row = array('q')  # Previous row bought by the same user, -1 for the first
+        self.last_row = {}  # user_id -> newest row, rebuilt on load
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __getstate__(self):
+        return (self.user_ids, self.type_codes, self.visit_days, self.num_people, self.prices, self.type_names)
+
+    def __setstate__(self, state):
+        self.user_ids, self.type_codes, self.visit_days, self.num_people, self.prices, self.type_names = state
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        self.previous_row = array('q')
+        self.last_row = {}
+        for row, user_id in enumerate(self.user_ids):
+            self.previous_row.append(self.last_row.get(user_id, -1))
+            self.last_row[user_id] = row
+
+    def add(self, user_id, ticket_type, visit_date, num_people, price):
+        if ticket_type not in self.type_names:
+            self.type_names.append(ticket_type)
+        self.user_ids.append(user_id)
+        self.type_codes.append(self.type_names.index(ticket_type))
+        self.visit_days.append(visit_date.toordinal())
+        self.num_people.append(num_people)
+        self.prices.append(price)
+        self.previous_row.append(self.last_row.get(user_id, -1))
+        self.last_row[user_id] = len(self.user_ids) - 1
+
+    def row(self, row):
+        return (self.type_names[self.type_codes[row]], datetime.date.fromordinal(self.visit_days[row]),
+                self.num_people[row], self.prices[row])
+
+    def rows(self, start=0, stop=None):
+        for row in range(start, len(self.user_ids) if stop is None else stop):
+            yield (self.user_ids[row],) + self.row(row)
+
+    def user_rows(self, user_id):
+        # Newest first, following the per-user chain instead of scanning the whole ledger
+        row = self.last_row.get(user_id, -1)
+        while row != -1:
+            yield row
+            row = self.previous_row[row]
+
+    def has_bought(self, user_id, ticket_type):
+        if ticket_type not in self.type_names:
+            return False
+        code = self.type_names.index(ticket_type)
+        return any(self.type_codes[row] == code for row in self.user_rows(user_id))
+
+    def tickets_for(self, user_id, offset=0, limit=None):
+        stop = None if limit is None else offset + limit
+        return [self.row(row) for row in itertools.islice(self.user_rows(user_id), offset, stop)]
+
+
+# Sales dates are entered as MM/DD/YYYY; stored sales are keyed by datetime.date
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return parse_date_text(value.strip())
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date_text(text):
+    # Same dates as strptime("%m/%d/%Y") without its per-call cost; "1/5/2025" and "01/05/2025" give one date
+    month, day, year = text.split("/")
+    if not (month.isdigit() and day.isdigit() and year.isdigit() and len(year) == 4):
+        raise ValueError(f"{text!r} is not a MM/DD/YYYY date")
+    return datetime.date(int(year), int(month), int(day))
+
+
+# Sales Index
+class SalesIndex:
+    # Tickets sold per day and ticket type, with a Fenwick tree per ticket type over day ordinals so a sale on
+    # any day is a point update and a range query is two prefix sums, both O(log days). Trees are sparse dicts
+    # spanning every possible date, so visit dates booked ahead or back-dated never force a rebuild.
+    size = 1 << 22  # Above datetime.date.max.toordinal()
+
+    def __init__(self):
+        self.days = {}  # date -> {ticket_type: tickets}
+        self.trees = {}  # ticket_type -> {node: tickets}
+        self.totals = {}  # Same tree over every ticket type
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_legacy(cls, ticket_sales):
+        # Older files store {"MM/DD/YYYY": tickets} with no ticket type
+        index = cls()
+        for date, num_tickets in ticket_sales.items():
+            try:
+                index.add(parse_date(date), "", num_tickets)
+            except ValueError:
+                pass  # Free-form keys that were never real dates
+        return index
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getstate__(self):
+        return self.days
+
+    def __setstate__(self, days):
+        self.__init__()
+        for date, day in days.items():
+            for ticket_type, num_tickets in day.items():
+                self.add(date, ticket_type, num_tickets)
+
+    def add(self, date, ticket_type, num_tickets):
+        with self.lock:
+            day = self.days.setdefault(date, {})
+            day[ticket_type] = day.get(ticket_type, 0) + num_tickets
+            tree = self.trees.setdefault(ticket_type, {})
+            node = date.toordinal()
+            while node < self.size:
+                tree[node] = tree.get(node, 0) + num_tickets
+                self.totals[node] = self.totals.get(node, 0) + num_tickets
+                node += node & -node
+
+    def rows(self):
+        for date, day in self.days.items():
+            for ticket_type, num_tickets in day.items():
+                yield date, ticket_type, num_tickets
+
+    @staticmethod
+    def prefix(tree, node):
+        # Tickets sold on days with ordinal <= node
+        result = 0
+        while node > 0:
+            result += tree.get(node, 0)
+            node -= node & -node
+        return result
+
+    def range_sum(self, tree, start, end):
+        return self.prefix(tree, end.toordinal()) - self.prefix(tree, start.toordinal() - 1)
+
+    def total(self, start, end):
+        with self.lock:
+            return self.range_sum(self.totals, start, end)
+
+    def breakdown(self, start, end):
+        with self.lock:
+            result = {}
+            for ticket_type, tree in self.trees.items():
+                num_tickets = self.range_sum(tree, start, end)
+                if num_tickets:
+                    result[ticket_type] = num_tickets
+            return result
+
+    def rolling_average(self, end, days=7):
+        # The window stops at date.min rather than overflowing for dates in the first week of year 1
+        start = datetime.date.fromordinal(max(1, end.toordinal() - (days - 1)))
+        return self.total(start, end) / days
+
+    def get(self, date):
+        return sum(self.days.get(date, {}).values())
+
+
+# Snapshot file helpers
+def file_checksum(path):
+    size = 0
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return size, crc
+
+
+# Snapshot writers return the (size, crc32) of what they wrote, so the manifest needs no second read
+class ChecksumWriter:
+    # Write-through file wrapper keeping the size and crc32 of everything written
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+        self.crc = 0
+
+    def write(self, data):
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return self.f.write(data)
+
+
+def gf2_matrix_times(matrix, vector):
+    result = 0
+    for row in matrix:
+        if not vector:
+            break
+        if vector & 1:
+            result ^= row
+        vector >>= 1
+    return result
+
+
+def crc32_combine(crc1, crc2, len2):
+    # crc32 of A + B from crc32(A), crc32(B) and len(B), as zlib's crc32_combine: crc1 is run through len2
+    # zero bytes by repeatedly squaring the one-zero-bit operator, then crc2 is folded in
+    if len2 <= 0:
+        return crc1  # crc32 of nothing is 0
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = [gf2_matrix_times(odd, row) for row in odd]  # Two zero bits
+    odd = [gf2_matrix_times(even, row) for row in even]  # Four zero bits
+    while len2:
+        even = [gf2_matrix_times(odd, row) for row in odd]
+        if len2 & 1:
+            crc1 = gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = [gf2_matrix_times(even, row) for row in even]
+        if len2 & 1:
+            crc1 = gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+    return crc1 ^ crc2
+
+
+# Pickles from older versions hold whole User, SalesIndex and TicketLedger instances, named under whichever
+# module ran the app (usually __main__); resolve them to this module's classes so any entry point can load them
+class DataUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module in ("__main__", __name__) and name in ("User", "SalesIndex", "TicketLedger"):
+            return globals()[name]
+        return super().find_class(module, name)
+
+
+def load_pickle(f):
+    return DataUnpickler(f).load()
+
+
+def load_ticket_ledger(f):
+    # Tickets files hold the ledger's plain state (arrays and a list); older ones the instance itself
+    state = load_pickle(f)
+    if isinstance(state, TicketLedger):
+        return state
+    ledger = TicketLedger()
+    ledger.__setstate__(state)
+    return ledger
+
+
+def dump_pickle(path, obj):
+    with open(path, 'wb') as f:
+        out = ChecksumWriter(f)
+        pickle.dump(obj, out)
+    return out.size, out.crc
+
+
+def dump_json(path, obj):
+    data = json.dumps(obj).encode()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return len(data), zlib.crc32(data)
+
+
+def fsync_dir(path):
+    # Make renames in path durable; directories cannot be opened for fsync on Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Record Files: versioned struct-packed snapshots that load without unpickling anything.
+# Layout: header, then one record per row, then an index of each record's file offset.
+record_magic = b"TPRF"
+record_version = 2
+record_header = struct.Struct("<4sH4sQQ")  # magic, schema version, kind, record count, index offset
+# Fixed part of each record by schema version. Version 1 used 16-bit string lengths, which capped
+# fields at 64 KiB; version 2 uses 32-bit lengths. Files of either version can be read.
+record_layouts = {
+    1: {b"USER": struct.Struct("<QHHH"), b"SALE": struct.Struct("<IqH"), b"DISC": struct.Struct("<dH")},
+    2: {b"USER": struct.Struct("<QIII"),  # user_id, then byte lengths of name, email and password
+        b"SALE": struct.Struct("<IqI"),  # date ordinal, tickets, byte length of ticket_type
+        b"DISC": struct.Struct("<dI")},  # discount percentage, byte length of ticket_type
+}
+user_record = record_layouts[record_version][b"USER"]
+sale_record = record_layouts[record_version][b"SALE"]
+discount_record = record_layouts[record_version][b"DISC"]
+
+
+def encode_user(user):
+    name, email, password = user.name.encode(), user.email.encode(), user.password.encode()
+    return user_record.pack(user.user_id, len(name), len(email), len(password)) + name + email + password
+
+
+def decode_user(buf, offset, layout=user_record):
+    user_id, name_len, email_len, password_len = layout.unpack_from(buf, offset)
+    name_at = offset + layout.size
+    email_at = name_at + name_len
+    password_at = email_at + email_len
+    end = password_at + password_len
+    return User(user_id, buf[name_at:email_at].decode(), buf[email_at:password_at].decode(),
+                buf[password_at:end].decode()), end
+
+
+def encode_sale(row):
+    date, ticket_type, num_tickets = row
+    ticket_type = ticket_type.encode()
+    return sale_record.pack(date.toordinal(), num_tickets, len(ticket_type)) + ticket_type
+
+
+def decode_sale(buf, offset, layout=sale_record):
+    ordinal, num_tickets, type_len = layout.unpack_from(buf, offset)
+    type_at = offset + layout.size
+    end = type_at + type_len
+    return (datetime.date.fromordinal(ordinal), buf[type_at:end].decode(), num_tickets), end
+
+
+def encode_discount(row):
+    ticket_type, discount_percentage = row
+    ticket_type = ticket_type.encode()
+    return discount_record.pack(discount_percentage, len(ticket_type)) + ticket_type
+
+
+def decode_discount(buf, offset, layout=discount_record):
+    discount_percentage, type_len = layout.unpack_from(buf, offset)
+    type_at = offset + layout.size
+    end = type_at + type_len
+    return (buf[type_at:end].decode(), discount_percentage), end
+
+
+record_codecs = {b"USER": (encode_user, decode_user),
+                 b"SALE": (encode_sale, decode_sale),
+                 b"DISC": (encode_discount, decode_discount)}
+
+
+def write_record_file(path, kind, rows):
+    # Returns the file's (size, crc32): the body is checksummed as it is written and the header folded in at the end
+    encode = record_codecs[kind][0]
+    offsets = array('Q')
+    with open(path, 'wb') as f:
+        f.write(bytes(record_header.size))  # Filled in once the count and index offset are known
+        out = ChecksumWriter(f)
+        position = record_header.size
+        chunk = []
+        for row in rows:
+            data = encode(row)
+            offsets.append(position)
+            position += len(data)
+            chunk.append(data)
+            if len(chunk) >= 4096:
+                out.write(b"".join(chunk))
+                chunk.clear()
+        out.write(b"".join(chunk))
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        out.write(offsets.tobytes())
+        f.seek(0)
+        header = record_header.pack(record_magic, record_version, kind, len(offsets), position)
+        f.write(header)
+    return record_header.size + out.size, crc32_combine(zlib.crc32(header), out.crc, out.size)
+
+
+class RecordFile:
+    # Memory-mapped reader: iterating streams records straight off the mapping, and
+    # record i is reached through the offset index without decoding the ones before it
+    def __init__(self, path, kind):
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, found_kind, self.count, self.index_offset = record_header.unpack_from(self.buf, 0)
+            if magic != record_magic or found_kind != kind:
+                raise ValueError(f"{path} is not a {kind.decode()} record file")
+            if version not in record_layouts:
+                raise ValueError(f"{path} has schema version {version}, this build reads up to {record_version}")
+            if self.index_offset + 8 * self.count != len(self.buf):
+                raise ValueError(f"{path} is truncated")
+        except (ValueError, struct.error):
+            self.buf.close()
+            raise
+        self.decode = record_codecs[kind][1]
+        self.layout = record_layouts[version][kind]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, = struct.unpack_from("<Q", self.buf, self.index_offset + 8 * i)
+        return self.decode(self.buf, offset, self.layout)[0]
+
+    def __iter__(self):
+        offset = record_header.size
+        for _ in range(self.count):
+            row, offset = self.decode(self.buf, offset, self.layout)
+            yield row
+
+    def close(self):
+        self.buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Storage Engines
+class FileStorage:
+    # Default engine: snapshot generations, each committed by its manifest, with an optional append-only journal.
+    # Every snapshot file is written to a temp name, fsynced and renamed; manifest-N.json is written the same
+    # way last, so a crash at any point leaves the previous generation intact.
+    def __init__(self, data_dir='data', journal_mode=False, compact_threshold=1000, read_only=False):
+        self.data_dir = data_dir
+        self.read_only = read_only  # Reading beside a running writer: never clean up, truncate or store
+        self.journal_mode = journal_mode  # Append mutations to journal.pkl instead of rewriting every snapshot file
+        self.compact_threshold = compact_threshold  # Journal records before folding them into a snapshot
+        self.journal_seq = 0  # Sequence number of the last applied mutation
+        self.journal_entries = 0  # Records in the journal since the last snapshot
+        self.generation = 0  # Newest snapshot generation on disk
+        self.manifest = None  # Manifest of the generation last loaded or written
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def generations(self):
+        # Generations that have a manifest, newest first
+        if not os.path.exists(self.data_dir):
+            return []
+        found = []
+        for name in os.listdir(self.data_dir):
+            if name.startswith('manifest-') and name.endswith('.json'):
+                try:
+                    found.append(int(name[len('manifest-'):-len('.json')]))
+                except ValueError:
+                    pass
+        return sorted(found, reverse=True)
+
+    def read_manifest(self, generation):
+        # The manifest, or None if it or any file it lists is missing or does not match its size and checksum
+        try:
+            with open(self.path(f'manifest-{generation:08d}.json')) as f:
+                manifest = json.load(f)
+            for name, size, crc in manifest["files"].values():
+                if file_checksum(self.path(name)) != (size, crc):
+                    return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return manifest
+
+    def load(self, system):
+        if self.read_only:
+            # The writer may snapshot and prune while we read: start over if files vanish under us
+            # or a newer generation lands before we finish
+            for attempt in range(10):
+                try:
+                    seen = self.load_once(system)
+                    if self.generations()[:1] == seen:
+                        return
+                except (OSError, ValueError, pickle.UnpicklingError):
+                    if attempt == 9:
+                        raise
+                time.sleep(0.05)
+                system.clear_data()
+            raise ValueError(f"{self.data_dir} kept changing while it was being read")
+
+        if os.path.exists(self.data_dir):
+            for name in os.listdir(self.data_dir):
+                if name.endswith('.tmp'):
+                    os.remove(self.path(name))  # Left by a store that crashed before its rename
+        self.load_once(system)
+
+    def load_once(self, system):
+        # Returns the newest generation on disk when the load started, as a list like generations()[:1]
+        self.journal_seq = 0
+        self.journal_entries = 0
+        generations = self.generations()
+        if generations:
+            self.generation = generations[0]
+        for generation in generations:
+            manifest = self.read_manifest(generation)
+            if manifest is not None:
+                self.load_generation(system, manifest)
+                break
+        else:
+            if generations:
+                raise ValueError(f"No intact snapshot generation in {self.data_dir}")
+            self.load_unversioned(system)
+            manifest = None
+
+        # Falling back to an older generation replays the journal segments rotated out since then
+        loaded = manifest["generation"] if manifest else 0
+        for generation in sorted(self.journal_segments()):
+            if generation > loaded:
+                self.replay_journal(system, f'journal-{generation:08d}.pkl')
+        self.replay_journal(system)
+        return generations[:1]
+
+    def load_generation(self, system, manifest):
+        files = {dataset: name for dataset, (name, size, crc) in manifest["files"].items()}
+        with RecordFile(self.path(files["users"]), b"USER") as records:
+            system.users = list(records)
+        system.rebuild_indexes()
+        system.last_user_id = max(system.last_user_id, manifest["last_user_id"])
+
+        system.ticket_sales = SalesIndex()
+        with RecordFile(self.path(files["sales"]), b"SALE") as records:
+            for date, ticket_type, num_tickets in records:
+                system.ticket_sales.add(date, ticket_type, num_tickets)
+
+        with RecordFile(self.path(files["discounts"]), b"DISC") as records:
+            system.discount_info = dict(records)
+
+        with open(self.path(files["capacities"]), 'rb') as f:
+            system.capacity_info = pickle.load(f)
+
+        with open(self.path(files["tickets"]), 'rb') as f:
+            system.ticket_ledger = load_ticket_ledger(f)
+
+        self.journal_seq = manifest["journal_seq"]
+        self.manifest = manifest
+
+    def load_unversioned(self, system):
+        # Data directories written before snapshot generations: plain pickles or record files
+        users = self.load_records('users.dat', b"USER")
+        if users is not None:
+            system.users = users
+        else:
+            try:
+                with open(self.path('users.pkl'), 'rb') as f:
+                    system.users = load_pickle(f)
+            except FileNotFoundError:
+                pass
+        system.rebuild_indexes()
+
+        sales = self.load_records('sales.dat', b"SALE")
+        if sales is not None:
+            system.ticket_sales = SalesIndex()
+            for date, ticket_type, num_tickets in sales:
+                system.ticket_sales.add(date, ticket_type, num_tickets)
+        else:
+            try:
+                with open(self.path('ticket_sales.pkl'), 'rb') as f:
+                    system.ticket_sales = load_pickle(f)
+                if isinstance(system.ticket_sales, dict):
+                    system.ticket_sales = SalesIndex.from_legacy(system.ticket_sales)
+            except FileNotFoundError:
+                pass
+
+        discounts = self.load_records('discounts.dat', b"DISC")
+        if discounts is not None:
+            system.discount_info = dict(discounts)
+        else:
+            try:
+                with open(self.path('discount_info.pkl'), 'rb') as f:
+                    system.discount_info = pickle.load(f)
+            except FileNotFoundError:
+                pass
 
-    def load_data(self):
         try:
-            with open('data/users.pkl', 'rb') as f:
-                self.users = pickle.load(f)
+            with open(self.path('capacity_info.pkl'), 'rb') as f:
+                system.capacity_info = pickle.load(f)
         except FileNotFoundError:
             pass
 
         try:
-            with open('data/ticket_sales.pkl', 'rb') as f:
-                self.ticket_sales = pickle.load(f)
+            with open(self.path('tickets.pkl'), 'rb') as f:
+                system.ticket_ledger = load_ticket_ledger(f)
         except FileNotFoundError:
             pass
 
         try:
-            with open('data/discount_info.pkl', 'rb') as f:
-                self.discount_info = pickle.load(f)
+            with open(self.path('id_allocator.pkl'), 'rb') as f:
+                system.last_user_id = max(system.last_user_id, pickle.load(f))
         except FileNotFoundError:
             pass
 
-    def store_data(self):
+        try:
+            with open(self.path('snapshot_seq.pkl'), 'rb') as f:
+                self.journal_seq = pickle.load(f)
+        except FileNotFoundError:
+            pass
+
+    def load_records(self, name, kind):
+        # None when the data directory predates record files
+        try:
+            with RecordFile(self.path(name), kind) as records:
+                return list(records)
+        except FileNotFoundError:
+            return None
+
+    def journal_segments(self):
+        # Generations whose journal-N.pkl holds the records folded into snapshot N
+        return [int(name[len('journal-'):-len('.pkl')]) for name in os.listdir(self.data_dir)
+                if name.startswith('journal-') and name.endswith('.pkl')] if os.path.exists(self.data_dir) else []
+
+    def replay_journal(self, system, name='journal.pkl'):
+        # Apply mutations recorded after the last snapshot
+        try:
+            with open(self.path(name), 'rb' if self.read_only else 'r+b') as f:
+                while True:
+                    good_end = f.tell()
+                    try:
+                        entry = pickle.load(f)
+                    except EOFError:
+                        break
+                    except pickle.UnpicklingError:
+                        # Drop a torn final write so new records are not appended after it. A reader
+                        # leaves it alone: it may be a record the writer is still appending.
+                        if not self.read_only:
+                            f.truncate(good_end)
+                        break
+                    # One pickled list per persist call; older journals hold single (seq, record) pairs
+                    for seq, record in (entry if isinstance(entry, list) else [entry]):
+                        if seq <= self.journal_seq:
+                            continue
+                        system.apply_record(record)
+                        self.journal_seq = seq
+                        if name == 'journal.pkl':
+                            self.journal_entries += 1
+        except FileNotFoundError:
+            pass
+
+    def write_file(self, name, write):
+        # Write through name.tmp, fsync and rename into place; write returns the file's (size, crc32), and this
+        # returns [name, size, crc32] for the manifest
+        temp = self.path(name + '.tmp')
+        size, crc = write(temp)
+        with open(temp, 'r+b') as f:
+            os.fsync(f.fileno())
+        os.replace(temp, self.path(name))
+        return [name, size, crc]
+
+    def store(self, system):
+        if self.read_only:
+            raise ValueError(f"{self.data_dir} was opened read-only")
         # Ensure the data directory exists
-        if not os.path.exists('data'):
-            os.makedirs('data')
-        
-        with open('data/users.pkl', 'wb') as f:
-            pickle.dump(self.users, f)
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+        # Snapshots are where deleted accounts' tombstones get reclaimed
+        system.compact_users()
+        generation = self.generation + 1
+        files = {
+            "users": self.write_file(f'users-{generation:08d}.dat',
+                                     lambda path: write_record_file(path, b"USER", system.users)),
+            "sales": self.write_file(f'sales-{generation:08d}.dat',
+                                     lambda path: write_record_file(path, b"SALE", system.ticket_sales.rows())),
+            "discounts": self.write_file(f'discounts-{generation:08d}.dat',
+                                         lambda path: write_record_file(path, b"DISC", system.discount_info.items())),
+            "capacities": self.write_file(f'capacities-{generation:08d}.pkl',
+                                          lambda path: dump_pickle(path, system.capacity_info)),
+            "tickets": self.write_file(f'tickets-{generation:08d}.pkl',
+                                       lambda path: dump_pickle(path, system.ticket_ledger.__getstate__())),
+        }
+        previous = self.manifest["generation"] if self.manifest else None  # Last generation known to be intact
+        manifest = {"generation": generation, "journal_seq": self.journal_seq,
+                    "last_user_id": system.last_user_id, "files": files}
+        # The rename of the manifest is the commit point of the whole snapshot
+        self.write_file(f'manifest-{generation:08d}.json', lambda path: dump_json(path, manifest))
+        fsync_dir(self.data_dir)
+        self.generation = generation
+        self.manifest = manifest
+
+        # The snapshot now covers everything in the journal; keep it as a segment for falling back
+        if os.path.exists(self.path('journal.pkl')):
+            os.replace(self.path('journal.pkl'), self.path(f'journal-{generation:08d}.pkl'))
+        self.journal_entries = 0
+        self.prune({generation, previous} - {None})
+
+    def prune(self, keep):
+        # Drop every generation not in keep, including corrupt or half-written ones, and the journal
+        # segments that are only needed to roll forward from generations older than keep
+        oldest = min(keep)
+        for name in os.listdir(self.data_dir):
+            stem, _, ext = name.partition('.')
+            prefix, _, number = stem.rpartition('-')
+            if ext not in ('dat', 'pkl', 'json') or not number.isdigit():
+                continue
+            if prefix == 'journal':
+                stale = int(number) <= oldest
+            elif prefix in ('manifest', 'users', 'sales', 'discounts', 'capacities', 'tickets'):
+                stale = int(number) not in keep
+            else:
+                continue
+            if stale:
+                os.remove(self.path(name))
+        # Files from before snapshot generations would only go stale now
+        for name in ('users.pkl', 'ticket_sales.pkl', 'discount_info.pkl', 'users.dat', 'sales.dat',
+                     'discounts.dat', 'capacity_info.pkl', 'tickets.pkl', 'id_allocator.pkl', 'snapshot_seq.pkl'):
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+
+    def snapshot_size(self):
+        # Bytes a store() writes: every file of a generation is written in full
+        return sum(size for name, size, crc in self.manifest["files"].values()) if self.manifest else 0
+
+    def persist(self, system, records):
+        if self.read_only:
+            raise ValueError(f"{self.data_dir} was opened read-only")
+        if not self.journal_mode:
+            self.journal_seq += len(records)
+            self.store(system)
+            return
+
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        entry = []
+        for record in records:
+            self.journal_seq += 1
+            entry.append((self.journal_seq, record))
+        with open(self.path('journal.pkl'), 'ab') as f:
+            # A single pickle per call, so a torn write drops a whole batch rather than part of it
+            pickle.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_entries += len(records)
+
+        if self.journal_entries >= self.compact_threshold:
+            self.store(system)
+
+
+class SQLiteStorage:
+    # Indexed tables in a WAL-mode database; each mutation is a single-row transaction
+    def __init__(self, db_path='data/themepark.db'):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS users ("
+                              "user_id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                              "email TEXT NOT NULL UNIQUE, password TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS tickets ("
+                              "ticket_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                              "ticket_type TEXT NOT NULL, visit_date TEXT NOT NULL, "
+                              "num_people INTEGER NOT NULL, price REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tickets_by_user ON tickets (user_id)")
+            self.upgrade_daily_sales()
+            self.conn.execute("CREATE TABLE IF NOT EXISTS daily_sales ("
+                              "date TEXT NOT NULL, ticket_type TEXT NOT NULL, num_tickets INTEGER NOT NULL, "
+                              "PRIMARY KEY (date, ticket_type))")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS discounts ("
+                              "ticket_type TEXT PRIMARY KEY, discount_percentage REAL NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS capacities ("
+                              "ticket_type TEXT PRIMARY KEY, daily_capacity INTEGER)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def upgrade_daily_sales(self):
+        # Databases created before per-type sales keyed daily_sales by the MM/DD/YYYY string alone
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(daily_sales)")]
+        if not columns or "ticket_type" in columns:
+            return
+        legacy = SalesIndex.from_legacy(dict(self.conn.execute("SELECT date, num_tickets FROM daily_sales")))
+        self.conn.execute("DROP TABLE daily_sales")
+        self.conn.execute("CREATE TABLE daily_sales ("
+                          "date TEXT NOT NULL, ticket_type TEXT NOT NULL, num_tickets INTEGER NOT NULL, "
+                          "PRIMARY KEY (date, ticket_type))")
+        self.conn.executemany("INSERT INTO daily_sales VALUES (?, ?, ?)",
+                              ((date.isoformat(), ticket_type, n) for date, ticket_type, n in legacy.rows()))
+
+    def load(self, system):
+        system.users = [User(user_id, name, email, password) for user_id, name, email, password
+                        in self.conn.execute("SELECT user_id, name, email, password FROM users ORDER BY user_id")]
+        system.rebuild_indexes()
+        for (last_user_id,) in self.conn.execute("SELECT value FROM counters WHERE name = 'last_user_id'"):
+            system.last_user_id = max(system.last_user_id, last_user_id)
+        system.ticket_ledger = TicketLedger()
+        for user_id, ticket_type, visit_date, num_people, price in self.conn.execute(
+                "SELECT user_id, ticket_type, visit_date, num_people, price FROM tickets ORDER BY ticket_id"):
+            system.ticket_ledger.add(user_id, ticket_type, datetime.date.fromisoformat(visit_date), num_people, price)
+        system.ticket_sales = SalesIndex()
+        for date, ticket_type, num_tickets in self.conn.execute(
+                "SELECT date, ticket_type, num_tickets FROM daily_sales"):
+            system.ticket_sales.add(datetime.date.fromisoformat(date), ticket_type, num_tickets)
+        system.discount_info = dict(self.conn.execute("SELECT ticket_type, discount_percentage FROM discounts"))
+        system.capacity_info = dict(self.conn.execute("SELECT ticket_type, daily_capacity FROM capacities"))
+
+    def store(self, system):
+        # Full rewrite, used by the migration tool
+        with self.conn:
+            for table in ("users", "tickets", "daily_sales", "discounts", "capacities"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)",
+                                  ((u.user_id, u.name, u.email, u.password) for u in system.users if u is not None))
+            self.set_last_user_id(system.last_user_id)
+            self.conn.executemany("INSERT INTO tickets (user_id, ticket_type, visit_date, num_people, price) "
+                                  "VALUES (?, ?, ?, ?, ?)",
+                                  ((user_id, ticket_type, visit_date.isoformat(), num_people, price)
+                                   for user_id, ticket_type, visit_date, num_people, price
+                                   in system.ticket_ledger.rows()))
+            self.conn.executemany("INSERT INTO daily_sales VALUES (?, ?, ?)",
+                                  ((date.isoformat(), ticket_type, num_tickets)
+                                   for date, ticket_type, num_tickets in system.ticket_sales.rows()))
+            self.conn.executemany("INSERT INTO discounts VALUES (?, ?)", system.discount_info.items())
+            self.conn.executemany("INSERT INTO capacities VALUES (?, ?)", system.capacity_info.items())
+
+    def snapshot_size(self):
+        size = os.path.getsize(self.db_path)
+        if os.path.exists(self.db_path + "-wal"):
+            size += os.path.getsize(self.db_path + "-wal")
+        return size
+
+    def persist(self, system, records):
+        # One transaction per call, whether it holds one record or a whole batch
+        with self.conn:
+            for record in records:
+                self.write_record(record)
+
+    def write_record(self, record):
+        op = record[0]
+        if op == "create_user":
+            _, user_id, name, email, password = record
+            self.conn.execute("INSERT INTO users VALUES (?, ?, ?, ?)", (user_id, name, email, password))
+            self.set_last_user_id(user_id)
+        elif op == "modify_user":
+            _, user_id, name, email, password = record
+            self.conn.execute("UPDATE users SET name = ?, email = ?, password = ? WHERE user_id = ?",
+                              (name, email, password, user_id))
+        elif op == "delete_user":
+            _, user_id = record
+            self.conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        elif op == "update_ticket_sales":
+            _, date, num_tickets, ticket_type = record
+            self.add_daily_sales(date, ticket_type, num_tickets)
+        elif op == "record_purchase":
+            _, user_id, ticket_type, visit_date, num_people, total_price = record
+            self.conn.execute("INSERT INTO tickets (user_id, ticket_type, visit_date, num_people, price) "
+                              "VALUES (?, ?, ?, ?, ?)",
+                              (user_id, ticket_type, visit_date.isoformat(), num_people, total_price))
+            self.add_daily_sales(visit_date, ticket_type, num_people)
+        elif op == "set_discount":
+            _, ticket_type, discount_percentage = record
+            self.conn.execute("INSERT OR REPLACE INTO discounts VALUES (?, ?)",
+                              (ticket_type, discount_percentage))
+        elif op == "set_capacity":
+            _, ticket_type, daily_capacity = record
+            self.conn.execute("INSERT OR REPLACE INTO capacities VALUES (?, ?)", (ticket_type, daily_capacity))
+
+    def set_last_user_id(self, user_id):
+        self.conn.execute("INSERT INTO counters VALUES ('last_user_id', ?) ON CONFLICT(name) "
+                          "DO UPDATE SET value = MAX(value, excluded.value)", (user_id,))
+
+    def add_daily_sales(self, date, ticket_type, num_tickets):
+        self.conn.execute("INSERT INTO daily_sales VALUES (?, ?, ?) ON CONFLICT(date, ticket_type) "
+                          "DO UPDATE SET num_tickets = num_tickets + excluded.num_tickets",
+                          (date.isoformat(), ticket_type, num_tickets))
+
+
+# Import an existing data/ snapshot into a SQLite database
+def migrate_to_sqlite(data_dir='data', db_path='data/themepark.db'):
+    source = System(FileStorage(data_dir))
+    source.load_data()
+    SQLiteStorage(db_path).store(source)
+    print(f"Migrated {source.user_count()} users, {len(source.ticket_sales)} sales days and "
+          f"{len(source.discount_info)} discounts from {data_dir} to {db_path}")
+
+
+# System Class
+class System:
+    def __init__(self, storage=None, password_iterations=None):
+        self.storage = storage or FileStorage()  # Pickle files under data/ unless another engine is given
+        self.password_iterations = password_iterations  # PBKDF2 cost for new hashes, None for the default
+        self.dummy_hash = None  # Random hash at the current cost, checked when there is no real one to check
+        self.users = []  # Deleted accounts leave a None tombstone until compact_users runs
+        self.users_by_email = {}  # Email -> User index for O(1) lookups
+        self.users_by_id = {}  # user_id -> User index
+        self.user_slots = {}  # user_id -> position in users, so a delete is O(1)
+        self.tombstones = 0
+        self.compact_ratio = 0.25  # Compact once this fraction of users are tombstones
+        self.last_user_id = 0  # Highest user_id ever handed out; persisted so IDs are never reused
+        self.id_stride = 1  # New IDs are congruent to id_offset modulo id_stride (set per shard)
+        self.id_offset = 0
+        # Fixed admin credentials, stored as a hash
+        self.admin_credentials = {"admin": "pbkdf2_sha256$100000$46a3ffe3d1b3dc7c42284ba1ace3a415$"
+                                           "557852ce18dcfcd38ceea3d9a940f7e27d6d39665eb5a45d5d69aa77bfcd6f8c"}
+        self.ticket_sales = SalesIndex()  # To track tickets sold per day and ticket type
+        self.discount_info = {}  # To store discount information
+        self.capacity_info = {}  # Daily ticket caps set by the admin, overriding default_capacity
+        self.ticket_ledger = TicketLedger()  # Every purchased ticket, kept even after the account is deleted
+        self.ready = threading.Event()  # Set once load_data has finished
+        self.lock = threading.RLock()  # Serializes check-then-write mutations across threads
+        self.pending = None  # Records waiting for the end of a batch()
+        self.calendar = ParkCalendar()  # Bookable days and their pricing tiers
+        self.pricing = PricingEngine(self)  # Cached price table, invalidated by discount changes
+        self.inventory = Inventory(self)  # Reservations against the daily caps
+        self.metrics = None  # Set by instrument() when timing is switched on
+
+    def clear_data(self):
+        # Back to an empty park, e.g. before a storage engine retries a load
+        self.users = []
+        self.tombstones = 0
+        self.last_user_id = 0
+        self.rebuild_indexes()
+        self.ticket_sales = SalesIndex()
+        self.discount_info = {}
+        self.capacity_info = {}
+        self.ticket_ledger = TicketLedger()
 
-        with open('data/ticket_sales.pkl', 'wb') as f:
-            pickle.dump(self.ticket_sales, f)
+    def load_data(self):
+        self.storage.load(self)
+        self.pricing.invalidate()
+        self.ready.set()
+
+    def store_data(self):
+        self.storage.store(self)
 
-        with open('data/discount_info.pkl', 'wb') as f:
-            pickle.dump(self.discount_info, f)
+    def persist(self, record):
+        if self.pending is not None:
+            self.pending.append(record)
+        else:
+            self.storage.persist(self, [record])
+
+    @contextmanager
+    def batch(self):
+        # Apply every mutation inside the block, then persist them with one storage commit
+        with self.lock:
+            self.pending = []
+            try:
+                yield
+            finally:
+                records, self.pending = self.pending, None
+                if records:
+                    self.storage.persist(self, records)
+
+    def apply_record(self, record):
+        # Every mutation is a record so it can be applied live or replayed from the journal
+        op = record[0]
+        if op == "create_user":
+            _, user_id, name, email, password = record
+            user = User(user_id, name, email, password)
+            self.user_slots[user_id] = len(self.users)
+            self.users.append(user)
+            self.users_by_email[email] = user
+            self.users_by_id[user_id] = user
+            self.last_user_id = max(self.last_user_id, user_id)
+        elif op == "modify_user":
+            _, user_id, name, email, password = record
+            user = self.users_by_id[user_id]
+            # Keep the email index in sync when the address changes
+            if self.users_by_email.get(user.email) is user:
+                del self.users_by_email[user.email]
+            user.name = name
+            user.email = email
+            user.password = password
+            self.users_by_email[email] = user
+        elif op == "delete_user":
+            _, user_id = record
+            user = self.users_by_id.pop(user_id)
+            self.users[self.user_slots.pop(user_id)] = None
+            self.tombstones += 1
+            if self.users_by_email.get(user.email) is user:
+                del self.users_by_email[user.email]
+            if self.tombstones > 1000 and self.tombstones > len(self.users) * self.compact_ratio:
+                self.compact_users()
+        elif op == "update_ticket_sales":
+            # Journals written before per-type sales hold (op, date, num_tickets)
+            date, num_tickets = record[1], record[2]
+            ticket_type = record[3] if len(record) > 3 else ""
+            self.ticket_sales.add(parse_date(date), ticket_type, num_tickets)
+        elif op == "record_purchase":
+            _, user_id, ticket_type, visit_date, num_people, total_price = record
+            self.ticket_ledger.add(user_id, ticket_type, visit_date, num_people, total_price)
+            self.ticket_sales.add(visit_date, ticket_type, num_people)
+        elif op == "set_discount":
+            _, ticket_type, discount_percentage = record
+            self.discount_info[ticket_type] = discount_percentage
+            self.pricing.invalidate()
+        elif op == "set_capacity":
+            _, ticket_type, daily_capacity = record
+            self.capacity_info[ticket_type] = daily_capacity
+
+    def commit(self, *record):
+        with self.lock:
+            self.apply_record(record)
+            self.persist(record)
+
+    def rebuild_indexes(self):
+        self.compact_users()
+        self.users_by_email = {user.email: user for user in self.users}
+        self.users_by_id = {user.user_id: user for user in self.users}
+        self.last_user_id = max(self.last_user_id, max(self.users_by_id, default=0))
+
+    def compact_users(self):
+        # Drop tombstones and renumber slots; IDs are untouched
+        if self.tombstones:
+            self.users = [user for user in self.users if user is not None]
+        self.user_slots = {user.user_id: slot for slot, user in enumerate(self.users)}
+        self.tombstones = 0
+
+    def user_count(self):
+        return len(self.users_by_id)
+
+    def get_user(self, user_id):
+        return self.users_by_id.get(user_id)
+
+    def get_user_by_email(self, email):
+        return self.users_by_email.get(email)
+
+    def get_bought_tickets(self, user, offset=0, limit=None):
+        # Newest first; offset/limit page through the history without materializing all of it
+        return self.ticket_ledger.tickets_for(user.user_id, offset, limit)
 
     def create_user(self, name, email, password):
-        if any(user.email == email for user in self.users):
-            return False, "Email already exists!"
-        user_id = len(self.users) + 1
-        new_user = User(user_id, name, email, password)
-        self.users.append(new_user)
-        self.store_data()
+        # Hash before taking the lock so concurrent signups are not serialized on PBKDF2
+        password_hash = hash_password(password, self.password_iterations)
+        with self.lock:
+            if email in self.users_by_email:
+                return False, "Email already exists!"
+            user_id = self.last_user_id + 1
+            user_id += (self.id_offset - user_id) % self.id_stride
+            self.commit("create_user", user_id, name, email, password_hash)
+        return True, "Account created successfully!"
+
+    def insert_user(self, user_id, name, email, password_hash):
+        # Add an existing account under its own ID, e.g. one moving in from another shard
+        with self.lock:
+            if email in self.users_by_email:
+                return False, "Email already exists!"
+            if user_id in self.users_by_id:
+                return False, "User ID already exists!"
+            self.commit("create_user", user_id, name, email, password_hash)
         return True, "Account created successfully!"
 
     def validate_user_login(self, email, password):
-        user = next((u for u in self.users if u.email == email and u.password == password), None)
-        if user:
-            return True, user
-        return False, None
+        user = self.users_by_email.get(email)
+        if user is None or not user.password.startswith("pbkdf2_sha256$"):
+            # Spend the same work as a real check so unknown emails and plaintext accounts are not faster to answer
+            if self.dummy_hash is None:
+                self.dummy_hash = hash_password(secrets.token_hex(16), self.password_iterations)
+            verify_password(self.dummy_hash, password)
+        if user is None or not verify_password(user.password, password):
+            return False, None
+        if needs_rehash(user.password, self.password_iterations):
+            # Upgrade plaintext or outdated hashes now that we have the password
+            password_hash = hash_password(password, self.password_iterations)
+            with self.lock:
+                if self.users_by_id.get(user.user_id) is user:
+                    self.commit("modify_user", user.user_id, user.name, user.email, password_hash)
+        return True, user
+
+    def validate_admin_login(self, username, password):
+        stored = self.admin_credentials.get(username)
+        return stored is not None and verify_password(stored, password)
 
     def modify_user(self, user, name, email, password):
-        if any(u.email == email and u.user_id != user.user_id for u in self.users):
-            return False, "Email already exists!"
-        user.name = name
-        user.email = email
-        user.password = password
-        self.store_data()
+        # An empty password keeps the current one
+        password_hash = hash_password(password, self.password_iterations) if password else None
+        with self.lock:
+            if user.user_id not in self.users_by_id:
+                return False, "Account not found!"
+            existing = self.users_by_email.get(email)
+            if existing is not None and existing.user_id != user.user_id:
+                return False, "Email already exists!"
+            self.commit("modify_user", user.user_id, name, email, password_hash or user.password)
         return True, "Account modified successfully!"
 
     def delete_user(self, user):
-        self.users.remove(user)
-        self.store_data()
+        with self.lock:
+            if user.user_id not in self.users_by_id:
+                return False, "Account not found!"
+            self.commit("delete_user", user.user_id)
         return True, "Account deleted successfully!"
 
-    def update_ticket_sales(self, date, num_tickets):
-        if date in self.ticket_sales:
-            self.ticket_sales[date] += num_tickets
-        else:
-            self.ticket_sales[date] = num_tickets
-        self.store_data()
+    def update_ticket_sales(self, date, num_tickets, ticket_type=""):
+        self.commit("update_ticket_sales", parse_date(date), num_tickets, ticket_type)
+
+    def record_purchase(self, user, ticket_type, visit_date, num_people, total_price):
+        self.commit("record_purchase", user.user_id, ticket_type, visit_date, num_people, total_price)
 
     def get_ticket_sales(self, date):
-        return self.ticket_sales.get(date, 0)
+        return self.ticket_sales.get(parse_date(date))
+
+    def get_sales_total(self, start, end):
+        return self.ticket_sales.total(parse_date(start), parse_date(end))
+
+    def get_sales_breakdown(self, start, end):
+        return self.ticket_sales.breakdown(parse_date(start), parse_date(end))
+
+    def get_rolling_average(self, end, days=7):
+        return self.ticket_sales.rolling_average(parse_date(end), days)
 
     def set_discount(self, ticket_type, discount_percentage):
-        self.discount_info[ticket_type] = discount_percentage
-        self.store_data()
+        self.commit("set_discount", ticket_type, discount_percentage)
 
     def get_discount(self, ticket_type):
         return self.discount_info.get(ticket_type, 0)
 
+    def set_capacity(self, ticket_type, daily_capacity):
+        # None removes the cap
+        self.commit("set_capacity", ticket_type, daily_capacity)
+
+    def get_capacity(self, ticket_type):
+        if ticket_type in self.capacity_info:
+            return self.capacity_info[ticket_type]
+        return default_capacity.get(ticket_type)
+
 
 # Ticket Information
 ticket_types = [
@@ -120,31 +1203,1070 @@ ticket_types = [
 ]
 
 
+# Shard worker: owns one System in its own process and serves calls sent over a pipe
+def shard_worker(conn, data_dir, journal_mode, password_iterations, shard, num_shards):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole process group; the parent closes us
+    system = System(FileStorage(data_dir, journal_mode=journal_mode), password_iterations)
+    system.id_stride, system.id_offset = num_shards, shard  # Each shard hands out its own residue class of IDs
+    system.load_data()
+    while True:
+        try:
+            method, args = conn.recv()
+        except EOFError:
+            break
+        if method == "close":
+            break
+        try:
+            conn.send((True, getattr(system, method)(*args)))
+        except Exception as e:
+            conn.send((False, e))
+    conn.close()
+
+
+# Sharded System: users partitioned by a hash of their email across worker processes. Everything that is not
+# an account (sales, discounts, capacities, tickets, pricing, inventory, the calendar) lives in one in-process
+# System under data_dir/main, so TicketService, the window and the API run on it unchanged.
+class ShardedSystem:
+    def __init__(self, num_shards, data_dir='data/shards', journal_mode=True, password_iterations=None):
+        self.password_iterations = password_iterations
+        self.metrics = None
+        self.main = System(FileStorage(os.path.join(data_dir, 'main'), journal_mode=journal_mode), password_iterations)
+        self.moves = {}  # user_id -> [source, target]; accounts between shards, see modify_user
+        self.moves_lock = threading.Lock()
+        self.shards = []  # (process, connection, lock) per shard
+        for shard in range(num_shards):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=shard_worker, daemon=True,
+                args=(child_conn, os.path.join(data_dir, f"shard-{shard}"), journal_mode, password_iterations,
+                      shard, num_shards))
+            process.start()
+            child_conn.close()
+            self.shards.append((process, parent_conn, threading.Lock()))
+        self.recover_moves()
+
+    def __getattr__(self, name):
+        # Only reached for attributes ShardedSystem does not define itself
+        if name == "main":
+            raise AttributeError(name)
+        return getattr(self.main, name)
+
+    def call(self, shard, method, *args):
+        _, conn, lock = self.shards[shard]
+        with lock:
+            conn.send((method, args))
+            success, result = conn.recv()
+        if not success:
+            raise result
+        return result
+
+    def shard_for(self, email):
+        # crc32 rather than hash() so the placement survives restarts
+        return zlib.crc32(email.encode()) % len(self.shards)
+
+    def close(self):
+        for process, conn, lock in self.shards:
+            with lock:
+                conn.send(("close", ()))
+            process.join()
+
+    def load_data(self):
+        # Shards load their own users when their process starts
+        self.main.load_data()
+
+    def store_data(self):
+        self.main.store_data()
+        for shard in range(len(self.shards)):
+            self.call(shard, "store_data")
+
+    def user_count(self):
+        return sum(self.call(shard, "user_count") for shard in range(len(self.shards)))
+
+    def save_moves(self):
+        # Called with moves_lock held
+        if not os.path.exists(self.main.storage.data_dir):
+            os.makedirs(self.main.storage.data_dir)
+        self.main.storage.write_file('moves.json', lambda path: dump_json(path, self.moves))
+        fsync_dir(self.main.storage.data_dir)
+
+    def recover_moves(self):
+        # Finish moves a crash interrupted: if the new shard has the account, drop the old copy, otherwise the
+        # insert never happened and the old shard still holds the only copy
+        try:
+            with open(self.main.storage.path('moves.json')) as f:
+                moves = json.load(f)
+        except FileNotFoundError:
+            return
+        for user_id, (source, target) in moves.items():
+            user_id = int(user_id)
+            if self.call(target, "get_user", user_id) is not None:
+                stale = self.call(source, "get_user", user_id)
+                if stale is not None:
+                    self.call(source, "delete_user", stale)
+        with self.moves_lock:
+            self.moves = {}
+            self.save_moves()
+
+    def create_user(self, name, email, password):
+        # The email's own shard is the only place it can exist, so its check is globally unique
+        return self.call(self.shard_for(email), "create_user", name, email, password)
+
+    def validate_user_login(self, email, password):
+        return self.call(self.shard_for(email), "validate_user_login", email, password)
+
+    def get_user_by_email(self, email):
+        return self.call(self.shard_for(email), "get_user_by_email", email)
+
+    def owner(self, user_id):
+        # (shard, user) currently holding user_id, or (None, None). Users move shards when their email changes,
+        # so route by ID: a caller's copy of the user may still carry the old email.
+        for shard in range(len(self.shards)):
+            user = self.call(shard, "get_user", user_id)
+            if user is not None:
+                return shard, user
+        return None, None
+
+    def get_user(self, user_id):
+        return self.owner(user_id)[1]
+
+    def modify_user(self, user, name, email, password):
+        source, current = self.owner(user.user_id)
+        if current is None:
+            return False, "Account not found!"
+        target = self.shard_for(email)
+        if source == target:
+            return self.call(source, "modify_user", current, name, email, password)
+
+        # A new email that hashes elsewhere moves the account: insert on the new owner first, which checks
+        # uniqueness, then remove it from the old shard. The move is recorded in moves.json first so a crash
+        # in between is finished by recover_moves rather than leaving the account on both shards.
+        password_hash = hash_password(password, self.password_iterations) if password else current.password
+        with self.moves_lock:
+            self.moves[current.user_id] = [source, target]
+            self.save_moves()
+        success, message = self.call(target, "insert_user", current.user_id, name, email, password_hash)
+        if success:
+            self.call(source, "delete_user", current)
+        with self.moves_lock:  # A shard error above leaves the record for recover_moves
+            del self.moves[current.user_id]
+            self.save_moves()
+        if not success:
+            return success, message
+        return True, "Account modified successfully!"
+
+    def delete_user(self, user):
+        shard, current = self.owner(user.user_id)
+        if current is None:
+            return False, "Account not found!"
+        return self.call(shard, "delete_user", current)
+
+
+# Pricing rules stated in the ticket descriptions
+pricing_rules = {
+    "Two-Day Pass": {"online_discount": 10},  # 10% discount for online purchase
+    "Annual Membership": {"renewal_discount": 15},  # 15% discount on renewal
+    "Group Ticket (10+)": {"min_people": 10, "group_size": 20, "group_discount": 20},  # 20% off for groups of 20 or more
+}
+
+
+# Pricing Engine
+class PricingEngine:
+    # Effective unit prices keyed by (ticket_type, online, renewal, large_group, tier), rebuilt after discount changes
+    def __init__(self, system):
+        self.system = system
+        self.table = None
+        self.version = 0
+        self.lock = threading.Lock()  # Makes the version check and the store in compile one step against invalidate
+
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+            self.table = None
+
+    def compile(self):
+        version = self.version
+        table = {}
+        tier_adjustments = self.system.calendar.season["tier_adjustments"]
+        for ticket_type, _, price, *_ in ticket_types:
+            rules = pricing_rules.get(ticket_type, {})
+            base = price * (1 - self.system.get_discount(ticket_type) / 100)
+            for online, renewal, large_group in itertools.product((False, True), repeat=3):
+                unit = base
+                if online:
+                    unit *= 1 - rules.get("online_discount", 0) / 100
+                if renewal:
+                    unit *= 1 - rules.get("renewal_discount", 0) / 100
+                if large_group:
+                    unit *= 1 - rules.get("group_discount", 0) / 100
+                for tier, adjustment in tier_adjustments.items():
+                    table[(ticket_type, online, renewal, large_group, tier)] = unit * (1 + adjustment / 100)
+        # A discount change while compiling means this table is already stale, so don't cache it
+        with self.lock:
+            if self.version == version:
+                self.table = table
+        return table
+
+    def quote(self, ticket_type, num_people, online=True, renewal=False, tier="off_peak"):
+        table = self.table
+        if table is None:
+            table = self.compile()
+        rules = pricing_rules.get(ticket_type, {})
+        if num_people < rules.get("min_people", 1):
+            return False, f"{ticket_type} requires at least {rules['min_people']} people."
+        large_group = "group_size" in rules and num_people >= rules["group_size"]
+        unit_price = table.get((ticket_type, online, renewal, large_group, tier))
+        if unit_price is None:
+            return False, "Invalid ticket type selected."
+        return True, unit_price * num_people
+
+
+# Park season: which days open, and the pricing tier of each open day
+park_season = {
+    "booking_horizon_days": 365,  # Tickets can be bought this far ahead
+    "closed_weekdays": (),  # date.weekday() numbers the park is shut every week, e.g. (0,) for Mondays
+    "closures": set(),  # Individual closed dates
+    "peak_weekdays": (5, 6),  # Saturdays and Sundays
+    "peak_dates": set(),  # Holidays and events priced as peak
+    "tier_adjustments": {"peak": 0, "off_peak": 0},  # Percent added to the price; 0 keeps the published prices
+}
+
+
+# Park Calendar
+class ParkCalendar:
+    # Every day of the booking window mapped to "closed", "peak" or "off_peak", rebuilt once a day
+    def __init__(self, season=None):
+        self.season = season or park_season
+        self.first_day = None
+        self.days = {}
+
+    def refresh(self, today):
+        season = self.season
+        days = {}
+        for offset in range(season["booking_horizon_days"] + 1):
+            day = today + datetime.timedelta(days=offset)
+            if day in season["closures"] or day.weekday() in season["closed_weekdays"]:
+                days[day] = "closed"
+            elif day in season["peak_dates"] or day.weekday() in season["peak_weekdays"]:
+                days[day] = "peak"
+            else:
+                days[day] = "off_peak"
+        # Publish the table before the day it starts from, so readers never pair a new day with an old table
+        self.days = days
+        self.first_day = today
+
+    def tier(self, day):
+        # (True, tier) for a bookable day, otherwise (False, reason)
+        today = datetime.date.today()
+        if self.first_day != today:
+            self.refresh(today)
+        tier = self.days.get(day)
+        if tier is None:
+            if day < today:
+                return False, "Visit date cannot be in the past."
+            return False, f"Tickets can only be booked up to {self.season['booking_horizon_days']} days ahead."
+        if tier == "closed":
+            return False, f"The park is closed on {day.strftime('%m/%d/%Y')}."
+        return True, tier
+
+
+# Daily ticket caps used until an admin sets one; types not listed are unlimited
+default_capacity = {
+    "VIP Experience Pass": 200,  # Limited availability
+}
+
+
+# Inventory
+class Inventory:
+    # Per-day, per-ticket-type availability with reserve/confirm/release so parallel checkouts cannot oversell
+    def __init__(self, system, hold_seconds=600):
+        self.system = system
+        self.hold_seconds = hold_seconds  # Unconfirmed reservations expire after this long
+        self.lock = threading.Lock()
+        self.held = {}  # (date, ticket_type) -> tickets held by open reservations
+        self.reservations = {}  # reservation_id -> (date, ticket_type, num_people, expires_at)
+        self.reservation_ids = itertools.count(1)
+
+    def sold(self, date, ticket_type):
+        return self.system.ticket_sales.days.get(date, {}).get(ticket_type, 0)
+
+    def available(self, date, ticket_type):
+        capacity = self.system.get_capacity(ticket_type)
+        if capacity is None:
+            return None
+        return capacity - self.sold(date, ticket_type) - self.held.get((date, ticket_type), 0)
+
+    def expire(self, now):
+        for reservation_id in [r for r, held in self.reservations.items() if held[3] < now]:
+            self.drop(reservation_id)
+
+    def drop(self, reservation_id):
+        date, ticket_type, num_people, _ = self.reservations.pop(reservation_id)
+        self.held[(date, ticket_type)] -= num_people
+        if not self.held[(date, ticket_type)]:
+            del self.held[(date, ticket_type)]
+
+    def reserve(self, date, ticket_type, num_people):
+        with self.lock:
+            now = time.monotonic()
+            self.expire(now)
+            available = self.available(date, ticket_type)
+            if available is not None and num_people > available:
+                if available <= 0:
+                    return False, f"{ticket_type} is sold out on {date.strftime('%m/%d/%Y')}."
+                return False, f"Only {available} {ticket_type} tickets left on {date.strftime('%m/%d/%Y')}."
+            reservation_id = next(self.reservation_ids)
+            self.reservations[reservation_id] = (date, ticket_type, num_people, now + self.hold_seconds)
+            self.held[(date, ticket_type)] = self.held.get((date, ticket_type), 0) + num_people
+            return True, reservation_id
+
+    def confirm(self, reservation_id, user, total_price):
+        with self.lock:
+            if reservation_id not in self.reservations:
+                return False, "Your reservation has expired, please try again."
+            date, ticket_type, num_people, _ = self.reservations[reservation_id]
+            # Keep the hold while recording so the tickets are never counted as free in between
+            self.reservations[reservation_id] = (date, ticket_type, num_people, float("inf"))
+        try:
+            self.system.record_purchase(user, ticket_type, date, num_people, total_price)
+        finally:
+            self.release(reservation_id)
+        return True, ""
+
+    def release(self, reservation_id):
+        with self.lock:
+            if reservation_id in self.reservations:
+                self.drop(reservation_id)
+
+
+# Payment Gateways
+class PaymentGateway:
+    # Interface for charging a validated payment; this base gateway approves every charge immediately
+    def charge(self, amount, payment_method, payment_details):
+        return True, ""
+
+    def refund(self, amount, payment_method, payment_details):
+        # Give back a successful charge whose tickets could not be recorded
+        return True, ""
+
+
+class FakePaymentGateway(PaymentGateway):
+    # Local stand-in for a remote gateway with configurable latency and failure rate
+    def __init__(self, latency=1.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def charge(self, amount, payment_method, payment_details):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            return False, f"{payment_method} payment was declined, please try again."
+        return True, ""
+
+    def refund(self, amount, payment_method, payment_details):
+        time.sleep(self.latency)
+        return True, ""
+
+
+# Ticket Service: the business rules behind the screens, usable without Tk
+class TicketService:
+    def __init__(self, system, online=True, gateway=None, payment_workers=4):
+        self.system = system
+        self.online = online  # Sales channel for the online-purchase discount
+        self.gateway = gateway or PaymentGateway()
+        self.payment_executor = ThreadPoolExecutor(max_workers=payment_workers)  # Runs purchase_async
+        if system.metrics is not None:
+            instrument_service(self, system.metrics)
+
+    def signup(self, name, email, password, confirm_password):
+        # Input validation
+        if not name or not email or not password:
+            return False, "All fields are required!"
+        if password != confirm_password:
+            return False, "Passwords do not match!"
+        if "@" not in email or "." not in email:
+            return False, "Invalid email format!"
+        return self.system.create_user(name, email, password)
+
+    def login(self, email, password):
+        return self.system.validate_user_login(email, password)
+
+    def admin_login(self, username, password):
+        return self.system.validate_admin_login(username, password)
+
+    def quote(self, ticket_type, num_people, visit_date, user=None):
+        success, order = self.price_order(ticket_type, num_people, visit_date, user)
+        if not success:
+            return False, order
+        return True, order[2]
+
+    def price_order(self, ticket_type, num_people, visit_date, user=None):
+        # Input validation
+        if not visit_date or not ticket_type or not num_people:
+            return False, "All fields are required!"
+
+        try:
+            num_people = int(num_people)
+            if num_people <= 0:
+                return False, "Number of people must be greater than zero!"
+        except ValueError:
+            return False, "Please enter a valid number for people!"
+
+        # Check if visit date format is MM/DD/YYYY
+        try:
+            visit_day = parse_date(visit_date)
+        except ValueError:
+            return False, "Invalid date format! Please use MM/DD/YYYY."
+        success, tier = self.system.calendar.tier(visit_day)
+        if not success:
+            return False, tier
+
+        # Renewal discounts apply when the user has bought this ticket type before
+        renewal = (user is not None and "renewal_discount" in pricing_rules.get(ticket_type, {})
+                   and self.system.ticket_ledger.has_bought(user.user_id, ticket_type))
+        success, total_price = self.system.pricing.quote(ticket_type, num_people, self.online, renewal, tier)
+        if not success:
+            return False, total_price
+        return True, (num_people, visit_day, total_price)
+
+    def validate_credit_card(self, card_number, expiry_date, cvv):
+        if len(card_number) != 16 or not card_number.isdigit():
+            return False, "Card number must be 16 digits."
+        try:
+            datetime.datetime.strptime(expiry_date, "%m/%y")
+        except ValueError:
+            return False, "Expiry date must be in MM/YY format."
+        if len(cvv) != 3 or not cvv.isdigit():
+            return False, "CVV must be 3 digits."
+        return True, ""
+
+    def validate_paypal(self, paypal_email, paypal_password):
+        if "@" not in paypal_email or "." not in paypal_email:
+            return False, "Invalid PayPal email format!"
+        if not paypal_password:
+            return False, "PayPal password cannot be empty!"
+        return True, ""
+
+    def purchase(self, user, ticket_type, num_people, visit_date, payment_method, payment_details):
+        if user is None:
+            return False, "Please log in to buy tickets."
+        if not payment_method:
+            return False, "All fields are required!"
+        success, order = self.price_order(ticket_type, num_people, visit_date, user)
+        if not success:
+            return False, order
+        num_people, visit_day, total_price = order
+
+        # Check payment details based on selected method
+        if payment_method == "Credit Card":
+            success, message = self.validate_credit_card(payment_details.get("card_number", ""),
+                                                         payment_details.get("expiry_date", ""),
+                                                         payment_details.get("cvv", ""))
+        elif payment_method == "PayPal":
+            success, message = self.validate_paypal(payment_details.get("paypal_email", ""),
+                                                    payment_details.get("paypal_password", ""))
+        else:
+            return False, "Invalid payment method selected."
+        if not success:
+            return False, message
+
+        # Hold the tickets while the gateway charges the payment
+        success, reservation_id = self.system.inventory.reserve(visit_day, ticket_type, num_people)
+        if not success:
+            return False, reservation_id
+        try:
+            success, message = self.gateway.charge(total_price, payment_method, payment_details)
+        except Exception as e:
+            success, message = False, f"Payment could not be processed: {e}"
+        if not success:
+            self.system.inventory.release(reservation_id)
+            return False, message
+
+        # One record updates the user's tickets and the daily sales together. The customer has paid by now,
+        # so if the hold ran out during the charge or recording fails, the charge is refunded.
+        try:
+            success, message = self.system.inventory.confirm(reservation_id, user, total_price)
+        except Exception:
+            self.refund(total_price, payment_method, payment_details)
+            raise
+        if not success:
+            if self.refund(total_price, payment_method, payment_details):
+                return False, f"{message} Your payment of {total_price:.2f} USD has been refunded."
+            return False, f"{message} Your payment could not be refunded automatically, please contact the park."
+        return True, f"Payment of {total_price:.2f} USD via {payment_method} was successful!"
+
+    def refund(self, total_price, payment_method, payment_details):
+        try:
+            success, _ = self.gateway.refund(total_price, payment_method, payment_details)
+        except Exception:
+            success = False
+        return success
+
+    def purchase_async(self, *args):
+        # Same as purchase, run on the payment pool; returns a Future of (success, message)
+        return self.payment_executor.submit(self.purchase, *args)
+
+    def my_tickets(self, user, page=0, page_size=10):
+        # One page of the user's tickets, newest first, and whether another page follows
+        tickets = self.system.get_bought_tickets(user, page * page_size, page_size + 1)
+        return tickets[:page_size], len(tickets) > page_size
+
+    def bulk_purchase(self, rows, batch_size=1000):
+        # Validate, price and record bookings chunk by chunk; each chunk is one storage commit.
+        # rows is any iterable of dicts with email, ticket_type, num_people and visit_date.
+        recorded = 0
+        errors = []
+        numbered = enumerate(rows, start=1)
+        while True:
+            chunk = list(itertools.islice(numbered, batch_size))
+            if not chunk:
+                break
+            with self.system.batch():
+                for row_number, row in chunk:
+                    try:
+                        success, message = self.book_row(row)
+                    except Exception as e:
+                        # One malformed row must not abort the rest of the import
+                        success, message = False, f"Could not record this booking: {e!r}"
+                    if not success:
+                        errors.append((row_number, message))
+                        continue
+                    recorded += 1
+        return recorded, errors
+
+    def book_row(self, row):
+        def field(name):
+            # Rows from JSON or code may hold numbers or None rather than CSV strings
+            value = row.get(name)
+            return "" if value is None else str(value).strip()
+
+        user = self.system.get_user_by_email(field("email"))
+        if user is None:
+            return False, "No account found for this email."
+        ticket_type = field("ticket_type")
+        success, order = self.price_order(ticket_type, field("num_people"), field("visit_date"), user)
+        if not success:
+            return False, order
+        num_people, visit_day, total_price = order
+        success, reservation_id = self.system.inventory.reserve(visit_day, ticket_type, num_people)
+        if not success:
+            return False, reservation_id
+        return self.system.inventory.confirm(reservation_id, user, total_price)
+
+    def ticket_sales(self, date):
+        try:
+            return True, self.system.get_ticket_sales(date)
+        except ValueError:
+            return False, "Please enter a valid date."
+
+    def sales_report(self, start, end=""):
+        # Totals, per-type breakdown and 7-day rolling average for one day or a date range
+        try:
+            start_day = parse_date(start)
+            end_day = parse_date(end) if end else start_day
+        except ValueError:
+            return False, "Please enter valid dates in MM/DD/YYYY format."
+        if end_day < start_day:
+            return False, "End date must not be before the start date."
+
+        total = self.system.get_sales_total(start_day, end_day)
+        if start_day == end_day:
+            lines = [f"Total tickets sold on {start}: {total}"]
+        else:
+            lines = [f"Total tickets sold from {start} to {end}: {total}"]
+        for ticket_type, num_tickets in sorted(self.system.get_sales_breakdown(start_day, end_day).items()):
+            lines.append(f"  {ticket_type or 'Unspecified'}: {num_tickets}")
+        lines.append(f"7-day average to {end_day.strftime('%m/%d/%Y')}: "
+                     f"{self.system.get_rolling_average(end_day):.1f} per day")
+        return True, "\n".join(lines)
+
+    def set_discount(self, ticket_type, discount_percentage):
+        if not ticket_type or not discount_percentage:
+            return False, "Please fill out all fields."
+        try:
+            discount_percentage = float(discount_percentage)
+        except ValueError:
+            return False, "Invalid discount value."
+        self.system.set_discount(ticket_type, discount_percentage)
+        return True, f"Discount for {ticket_type} updated to {discount_percentage}%"
+
+    def set_capacity(self, ticket_type, daily_capacity):
+        if not ticket_type:
+            return False, "Please select a ticket type."
+        if not daily_capacity:
+            self.system.set_capacity(ticket_type, None)
+            return True, f"{ticket_type} is no longer capped"
+        try:
+            daily_capacity = int(daily_capacity)
+            if daily_capacity < 0:
+                raise ValueError
+        except ValueError:
+            return False, "Capacity must be a whole number of tickets."
+        self.system.set_capacity(ticket_type, daily_capacity)
+        return True, f"Daily capacity for {ticket_type} set to {daily_capacity}"
+
+
+# Latency histogram bucket bounds in seconds
+latency_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Metrics: call counts, latency histograms and snapshot sizes, exported as Prometheus text or JSON
+class Metrics:
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.calls = {}  # name -> [calls, errors, total seconds, count per bucket..., count above the last bucket]
+        self.store_bytes = []  # Snapshot size after each storage store
+
+    def observe(self, name, seconds, failed=False):
+        with self.lock:
+            stats = self.calls.get(name)
+            if stats is None:
+                stats = self.calls[name] = [0, 0, 0.0] + [0] * (len(self.buckets) + 1)
+            stats[0] += 1
+            stats[1] += failed
+            stats[2] += seconds
+            stats[3 + bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def add_store_bytes(self, size):
+        with self.lock:
+            self.store_bytes.append(size)
+
+    def timed(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.observe(name, time.perf_counter() - start, failed)
+        return wrapper
+
+    def snapshot(self):
+        with self.lock:
+            calls = {name: {"calls": stats[0], "errors": stats[1], "seconds": stats[2],
+                            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], stats[3:]))}
+                     for name, stats in sorted(self.calls.items())}
+            return {"calls": calls, "store_bytes": list(self.store_bytes)}
+
+    def to_prometheus(self):
+        data = self.snapshot()
+        lines = ["# TYPE themepark_calls_total counter"]
+        lines += [f'themepark_calls_total{{method="{name}"}} {stats["calls"]}' for name, stats in data["calls"].items()]
+        lines.append("# TYPE themepark_call_errors_total counter")
+        lines += [f'themepark_call_errors_total{{method="{name}"}} {stats["errors"]}'
+                  for name, stats in data["calls"].items()]
+        lines.append("# TYPE themepark_call_duration_seconds histogram")
+        for name, stats in data["calls"].items():
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                lines.append(f'themepark_call_duration_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'themepark_call_duration_seconds_sum{{method="{name}"}} {stats["seconds"]:.6f}')
+            lines.append(f'themepark_call_duration_seconds_count{{method="{name}"}} {stats["calls"]}')
+        lines.append("# TYPE themepark_store_bytes_total counter")
+        lines.append(f"themepark_store_bytes_total {sum(data['store_bytes'])}")
+        lines.append("# TYPE themepark_store_bytes_last gauge")
+        lines.append(f"themepark_store_bytes_last {data['store_bytes'][-1] if data['store_bytes'] else 0}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # A .json path gets a JSON snapshot, anything else the Prometheus text format
+        with open(path, 'w') as f:
+            if path.endswith(".json"):
+                json.dump(self.snapshot(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+
+# Session profiler for --profile. Before Python 3.12 a cProfile.Profile only sees the thread that enabled it,
+# so every thread started afterwards (API and payment pools, background loading) gets its own, merged on dump.
+class SessionProfiler:
+    def __init__(self):
+        self.profiles = [cProfile.Profile()]
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.profiles[0].enable()
+        if sys.version_info < (3, 12):  # From 3.12 cProfile uses sys.monitoring, which covers every thread
+            threading.setprofile(self.start_thread)
+
+    def start_thread(self, frame, event, arg):
+        # Runs on a new thread's first profile event; the thread's own Profile replaces it from then on
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def dump(self, path):
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        with self.lock:
+            stats = pstats.Stats(*self.profiles)
+        stats.dump_stats(path)
+
+
+# Wrap a System's methods and storage engine so every call is timed into metrics
+def instrument(system, metrics):
+    system.metrics = metrics
+    for name in ("load_data", "commit", "persist", "create_user", "insert_user", "validate_user_login",
+                 "validate_admin_login", "get_user_by_email", "modify_user", "delete_user", "set_discount",
+                 "set_capacity"):
+        setattr(system, name, metrics.timed(f"system_{name}", getattr(system, name)))
+    system.store_data = metrics.timed("system_store_data", system.store_data)
+    # Storage load is pickle.load for FileStorage, table scans for SQLite
+    system.storage.load = metrics.timed("storage_load", system.storage.load)
+    # FileStorage.persist also snapshots, so sizes are taken around storage.store rather than store_data
+    store = metrics.timed("storage_store", system.storage.store)
+
+    def store_and_measure(target):
+        store(target)
+        metrics.add_store_bytes(system.storage.snapshot_size())
+    system.storage.store = store_and_measure
+    for name in ("reserve", "confirm", "release"):
+        setattr(system.inventory, name, metrics.timed(f"inventory_{name}", getattr(system.inventory, name)))
+    system.pricing.quote = metrics.timed("pricing_quote", system.pricing.quote)
+
+
+# Time the purchase flow of a TicketService; called by TicketService when its System is instrumented
+def instrument_service(service, metrics):
+    for name in ("signup", "login", "quote", "price_order", "purchase", "my_tickets", "bulk_purchase",
+                 "sales_report"):
+        setattr(service, name, metrics.timed(f"service_{name}", getattr(service, name)))
+    service.gateway.charge = metrics.timed("payment_charge", service.gateway.charge)
+    service.gateway.refund = metrics.timed("payment_refund", service.gateway.refund)
+
+
+# HTTP API: JSON over keep-alive HTTP/1.1 for gates, kiosks and mobile sales, backed by TicketService.
+# Log in through /login or /admin/login and send the token back as "Authorization: Bearer <token>".
+class ApiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep connections open between requests
+    timeout = 30  # Seconds an idle keep-alive connection may hold a worker
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait on delayed ACKs
+    routes = {
+        ("POST", "/signup"): "api_signup",
+        ("POST", "/login"): "api_login",
+        ("POST", "/admin/login"): "api_admin_login",
+        ("POST", "/logout"): "api_logout",
+        ("GET", "/quote"): "api_quote",
+        ("POST", "/purchase"): "api_purchase",
+        ("GET", "/tickets"): "api_tickets",
+        ("GET", "/admin/sales"): "api_sales",
+        ("POST", "/admin/discount"): "api_discount",
+        ("POST", "/admin/capacity"): "api_capacity",
+    }
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            parsed = json.loads(body) if body else {}
+        except ValueError:
+            parsed = None
+        if not isinstance(parsed, dict):
+            return self.reply(400, {"ok": False, "message": "Request body must be a JSON object."})
+        params.update(parsed)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            return self.reply(404, {"ok": False, "message": f"No route for {method} {url.path}"})
+        try:
+            status, payload = getattr(self, handler)(params)
+        except Exception as e:
+            self.log_error("%s %s failed: %r", method, url.path, e)
+            status, payload = 500, {"ok": False, "message": "Internal error."}
+        self.reply(status, payload)
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def token(self):
+        return self.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+
+    def session(self):
+        # (user, is_admin) for the bearer token, or (None, False)
+        user_id = self.server.lookup_session(self.token())
+        if user_id == "admin":
+            return None, True
+        return (self.server.service.system.get_user(user_id) if user_id is not None else None), False
+
+    @staticmethod
+    def text(value):
+        # A JSON null counts as a missing field, not the string "None"
+        return "" if value is None else str(value)
+
+    def result(self, success, message, **fields):
+        return (200 if success else 400), {"ok": success, "message": message, **fields}
+
+    def api_signup(self, params):
+        return self.result(*self.server.service.signup(self.text(params.get("name")),
+                                                       self.text(params.get("email")), self.text(params.get("password")),
+                                                       self.text(params.get("confirm_password", params.get("password")))))
+
+    def api_login(self, params):
+        success, user = self.server.service.login(self.text(params.get("email")), self.text(params.get("password")))
+        if not success:
+            return 401, {"ok": False, "message": "Invalid email or password!"}
+        return self.result(True, f"Welcome, {user.name}!", token=self.server.open_session(user.user_id),
+                           user_id=user.user_id)
+
+    def api_admin_login(self, params):
+        if not self.server.service.admin_login(self.text(params.get("username")), self.text(params.get("password"))):
+            return 401, {"ok": False, "message": "Invalid admin credentials!"}
+        return self.result(True, "Admin login successful!", token=self.server.open_session("admin"))
+
+    def api_logout(self, params):
+        if not self.server.close_session(self.token()):
+            return 401, {"ok": False, "message": "Not logged in."}
+        return self.result(True, "Logged out.")
+
+    def api_quote(self, params):
+        user, is_admin = self.session()
+        success, total_price = self.server.service.quote(self.text(params.get("ticket_type")),
+                                                         self.text(params.get("num_people")),
+                                                         self.text(params.get("visit_date")), user)
+        if not success:
+            return self.result(False, total_price)
+        return self.result(True, f"Total price: {total_price:.2f} USD", total_price=total_price)
+
+    def api_purchase(self, params):
+        user, is_admin = self.session()
+        if user is None:
+            return 401, {"ok": False, "message": "Please log in to buy tickets."}
+        payment_details = params.get("payment_details")
+        return self.result(*self.server.service.purchase(
+            user, self.text(params.get("ticket_type")), self.text(params.get("num_people")),
+            self.text(params.get("visit_date")), self.text(params.get("payment_method")),
+            payment_details if isinstance(payment_details, dict) else {}))
+
+    def api_tickets(self, params):
+        user, is_admin = self.session()
+        if user is None:
+            return 401, {"ok": False, "message": "Please log in to see your tickets."}
+        try:
+            page = int(params.get("page") or 0)
+        except (TypeError, ValueError):
+            return self.result(False, "Page must be a number.")
+        tickets, more = self.server.service.my_tickets(user, max(page, 0))
+        return self.result(True, f"{len(tickets)} tickets", more=more, tickets=[
+            {"ticket_type": ticket_type, "visit_date": visit_date.strftime("%m/%d/%Y"),
+             "num_people": num_people, "price": price}
+            for ticket_type, visit_date, num_people, price in tickets])
+
+    def api_sales(self, params):
+        user, is_admin = self.session()
+        if not is_admin:
+            return 403, {"ok": False, "message": "Admin login required."}
+        system = self.server.service.system
+        try:
+            start_day = parse_date(self.text(params.get("start")))
+            end_day = parse_date(self.text(params.get("end") or params.get("start")))
+        except ValueError:
+            return self.result(False, "Please enter valid dates in MM/DD/YYYY format.")
+        if end_day < start_day:
+            return self.result(False, "End date must not be before the start date.")
+        return self.result(True, "Sales report", total=system.get_sales_total(start_day, end_day),
+                           by_type=system.get_sales_breakdown(start_day, end_day),
+                           rolling_average=system.get_rolling_average(end_day))
+
+    def api_discount(self, params):
+        user, is_admin = self.session()
+        if not is_admin:
+            return 403, {"ok": False, "message": "Admin login required."}
+        return self.result(*self.server.service.set_discount(self.text(params.get("ticket_type")),
+                                                             self.text(params.get("discount_percentage"))))
+
+    def api_capacity(self, params):
+        user, is_admin = self.session()
+        if not is_admin:
+            return 403, {"ok": False, "message": "Admin login required."}
+        return self.result(*self.server.service.set_capacity(self.text(params.get("ticket_type")),
+                                                             self.text(params.get("daily_capacity"))))
+
+
+class ApiServer(http.server.HTTPServer):
+    # Connections are handed to a fixed thread pool; a keep-alive connection holds its worker until it closes.
+    # At most `workers` connections are open at once: one more would only queue behind idle kiosks, so it is
+    # answered 503 straight away and the client can retry once someone disconnects or idles out (ApiHandler.timeout)
+    daemon_threads = True
+    request_queue_size = 128  # Listen backlog; the default of 5 drops bursts of kiosks connecting at once
+    session_ttl = 8 * 3600  # Seconds a token stays valid after its last use
+    busy_response = (b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\nRetry-After: 1\r\n"
+                     b"Connection: close\r\nContent-Length: 56\r\n\r\n"
+                     b'{"ok": false, "message": "Server busy, try again soon."}')
+
+    def __init__(self, address, service, workers=32, verbose=False):
+        super().__init__(address, ApiHandler)
+        self.service = service
+        self.verbose = verbose  # Log every request to stderr
+        self.sessions = {}  # token -> [user_id or "admin", expires_at]
+        self.sessions_lock = threading.Lock()
+        self.next_sweep = time.monotonic() + 60
+        self.max_connections = workers
+        self.connections = 0
+        self.connections_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def open_session(self, user_id):
+        token = secrets.token_urlsafe(24)
+        now = time.monotonic()
+        with self.sessions_lock:
+            if now >= self.next_sweep:  # Drop tokens nobody came back for, at most once a minute
+                self.sessions = {t: s for t, s in self.sessions.items() if s[1] > now}
+                self.next_sweep = now + 60
+            self.sessions[token] = [user_id, now + self.session_ttl]
+        return token
+
+    def lookup_session(self, token):
+        now = time.monotonic()
+        with self.sessions_lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            if session[1] <= now:
+                del self.sessions[token]
+                return None
+            session[1] = now + self.session_ttl
+            return session[0]
+
+    def close_session(self, token):
+        with self.sessions_lock:
+            return self.sessions.pop(token, None) is not None
+
+    def process_request(self, request, client_address):
+        with self.connections_lock:
+            accepted = self.connections < self.max_connections
+            if accepted:
+                self.connections += 1
+        if not accepted:
+            try:
+                request.sendall(self.busy_response)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.executor.submit(self.process_request_in_worker, request, client_address)
+
+    def process_request_in_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.connections_lock:
+                self.connections -= 1
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def serve_api(system, host="127.0.0.1", port=8080, workers=32, gateway=None, verbose=True):
+    server = ApiServer((host, port), TicketService(system, gateway=gateway), workers, verbose)
+    print(f"Serving the ticket API on http://{host}:{server.server_address[1]} with {workers} workers "
+          f"(at most {workers} open connections)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# Session Manager: one Tk root for the whole kiosk; screens are frames built on first use and reused
+class SessionManager:
+    def __init__(self, root, system):
+        self.root = root
+        self.system = system
+        self.builders = {}  # Screen name -> builder(frame) returning a refresh callback, or None
+        self.frames = {}  # Screen name -> (frame, refresh) once built
+        self.current = None
+        self.user_id = None  # Logged-in user, looked up on use so account changes show through
+        self.windows = []  # Toplevels opened during the session, closed at logout
+
+    def register(self, name, builder):
+        self.builders[name] = builder
+
+    def show(self, name):
+        if name not in self.frames:
+            import tkinter as tk
+            frame = tk.Frame(self.root)
+            self.frames[name] = (frame, self.builders[name](frame))
+        if self.current is not None:
+            self.frames[self.current][0].pack_forget()
+        frame, refresh = self.frames[name]
+        if refresh is not None:
+            refresh()
+        frame.pack(fill="both", expand=True)
+        self.current = name
+
+    @property
+    def user(self):
+        return self.system.get_user(self.user_id) if self.user_id is not None else None
+
+    def login(self, user):
+        self.user_id = user.user_id
+        self.show("dashboard")
+
+    def logout(self):
+        for window in self.windows:
+            if window.winfo_exists():
+                window.destroy()
+        self.windows.clear()
+        self.user_id = None
+        self.show("main")
+
+    def open_window(self, title, geometry, bg="#f0f4f7"):
+        # A Toplevel that belongs to the logged-in user and goes away when they log out
+        import tkinter as tk
+        self.windows = [window for window in self.windows if window.winfo_exists()]
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry(geometry)
+        window.configure(bg=bg)
+        self.windows.append(window)
+        return window
+
+
 # Tkinter GUI Implementation
-def main_screen(system):
+def main_screen(system, load_in_background=False, started_at=None, gateway=None, mainloop=True):
+    # With mainloop=False the window is built and its SessionManager returned instead of running the event loop
+    import tkinter as tk
+    from tkinter import messagebox, ttk
+    service = TicketService(system, gateway=gateway)
+
+    def data_ready():
+        if not system.ready.is_set():
+            messagebox.showinfo("Please Wait", "Park data is still loading, please try again in a moment.")
+            return False
+        return True
+
     def create_account_screen():
         def create_account():
-            name = name_entry.get()
-            email = email_entry.get()
-            password = password_entry.get()
-            confirm_password = confirm_password_entry.get()
-
-            # Input validation
-            if not name or not email or not password:
-                messagebox.showerror("Error", "All fields are required!")
-                return
-            if password != confirm_password:
-                messagebox.showerror("Error", "Passwords do not match!")
-                return
-            if "@" not in email or "." not in email:
-                messagebox.showerror("Error", "Invalid email format!")
+            if not data_ready():
                 return
-
-            success, message = system.create_user(name, email, password)
+            success, message = service.signup(name_entry.get(), email_entry.get(), password_entry.get(),
+                                              confirm_password_entry.get())
             if success:
                 messagebox.showinfo("Success", message)
                 create_window.destroy()
-               
             else:
                 messagebox.showerror("Error", message)
 
@@ -176,13 +2298,15 @@ def main_screen(system):
 
     def user_login_screen():
         def validate_login():
+            if not data_ready():
+                return
             email = email_entry.get()
             password = password_entry.get()
-            success, user = system.validate_user_login(email, password)
+            success, user = service.login(email, password)
             if success:
                 messagebox.showinfo("Success", f"Welcome, {user.name}!")
                 login_window.destroy()
-                user_dashboard(user)
+                sessions.login(user)
             else:
                 messagebox.showerror("Error", "Invalid email or password!")
 
@@ -206,9 +2330,11 @@ def main_screen(system):
 
     def admin_login_screen():
         def validate_admin_login():
+            if not data_ready():
+                return
             username = username_entry.get()
             password = password_entry.get()
-            if username in system.admin_credentials and system.admin_credentials[username] == password:
+            if service.admin_login(username, password):
                 messagebox.showinfo("Success", "Welcome, Admin!")
                 admin_window.destroy()
                 admin_dashboard()
@@ -236,89 +2362,40 @@ def main_screen(system):
     def manage_tickets_screen(user):
         def buy_ticket():
             def calculate_price():
-                ticket_type = ticket_type_combobox.get()
-                num_people = num_people_entry.get()
-                visit_date = visit_date_entry.get()
-                payment_method = payment_method_var.get()
-
-                # Input validation
-                if not visit_date or not ticket_type or not num_people or not payment_method:
-                    messagebox.showerror("Error", "All fields are required!")
-                    return
-
-                try:
-                    num_people = int(num_people)
-                    if num_people <= 0:
-                        messagebox.showerror("Error", "Number of people must be greater than zero!")
-                        return
-                except ValueError:
-                    messagebox.showerror("Error", "Please enter a valid number for people!")
+                payment_details = {
+                    "card_number": card_number_entry.get(),
+                    "expiry_date": expiry_date_entry.get(),
+                    "cvv": cvv_entry.get(),
+                    "paypal_email": paypal_email_entry.get(),
+                    "paypal_password": paypal_password_entry.get(),
+                }
+                # Pay off the Tk thread and poll for the result so the window keeps responding
+                future = service.purchase_async(user, ticket_type_combobox.get(), num_people_entry.get(),
+                                                visit_date_entry.get(), payment_method_var.get(), payment_details)
+                purchase_button.config(state=tk.DISABLED)
+                progress_label.config(text="Processing payment...")
+                progress_bar.pack(pady=5)
+                progress_bar.start(10)
+                ticket_window.after(50, check_payment, future)
+
+            def check_payment(future):
+                if not future.done():
+                    ticket_window.after(50, check_payment, future)
                     return
-
-                # Check if visit date format is MM/DD/YYYY
-                try:
-                    datetime.datetime.strptime(visit_date, "%m/%d/%Y")
-                except ValueError:
-                    messagebox.showerror("Error", "Invalid date format! Please use MM/DD/YYYY.")
+                if not ticket_window.winfo_exists():
                     return
-
-                # Find ticket details
-                ticket_info = next(t for t in ticket_types if t[0] == ticket_type)
-                price_per_ticket = ticket_info[2]
-
-                # Apply discount
-                discount = system.get_discount(ticket_type)
-                total_price = price_per_ticket * num_people * (1 - discount / 100)
-
-                # Process payment based on selected method
-                if payment_method == "Credit Card":
-                    validate_credit_card_payment(total_price)
-                elif payment_method == "PayPal":
-                    validate_paypal_payment(total_price)
+                progress_bar.stop()
+                progress_bar.pack_forget()
+                progress_label.config(text="")
+                purchase_button.config(state=tk.NORMAL)
+                success, message = future.result()
+                if success:
+                    messagebox.showinfo("Success", message)
+                    ticket_window.destroy()
                 else:
-                    messagebox.showerror("Error", "Invalid payment method selected.")
+                    messagebox.showerror("Error", message)
 
-            def validate_credit_card_payment(total_price):
-                card_number = card_number_entry.get()
-                expiry_date = expiry_date_entry.get()
-                cvv = cvv_entry.get()
-
-                # Credit Card Validation
-                if len(card_number) != 16 or not card_number.isdigit():
-                    messagebox.showerror("Error", "Card number must be 16 digits.")
-                    return
-                try:
-                    datetime.datetime.strptime(expiry_date, "%m/%y")
-                except ValueError:
-                    messagebox.showerror("Error", "Expiry date must be in MM/YY format.")
-                    return
-                if len(cvv) != 3 or not cvv.isdigit():
-                    messagebox.showerror("Error", "CVV must be 3 digits.")
-                    return
-                
-                # If validation is successful
-                messagebox.showinfo("Success", f"Payment of {total_price:.2f} USD via Credit Card was successful!")
-                ticket_window.destroy()
-
-            def validate_paypal_payment(total_price):
-                paypal_email = paypal_email_entry.get()
-                paypal_password = paypal_password_entry.get()
-
-                if "@" not in paypal_email or "." not in paypal_email:
-                    messagebox.showerror("Error", "Invalid PayPal email format!")
-                    return
-                if not paypal_password:
-                    messagebox.showerror("Error", "PayPal password cannot be empty!")
-                    return
-
-                # If validation is successful
-                messagebox.showinfo("Success", f"Payment of {total_price:.2f} USD via PayPal was successful!")
-                ticket_window.destroy()
-
-            ticket_window = tk.Toplevel(root)
-            ticket_window.title("Manage Tickets")
-            ticket_window.geometry("400x500")
-            ticket_window.configure(bg="#f0f4f7")
+            ticket_window = sessions.open_window("Manage Tickets", "400x650")
 
             tk.Label(ticket_window, text="Manage Tickets", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
 
@@ -361,129 +2438,168 @@ def main_screen(system):
             paypal_password_entry = tk.Entry(ticket_window, width=30, show="*")
             paypal_password_entry.pack()
 
-            tk.Button(ticket_window, text="Purchase Tickets", bg="#4CAF50", fg="white", font=("Arial", 12), 
-                      command=calculate_price).pack(pady=15)
+            purchase_button = tk.Button(ticket_window, text="Purchase Tickets", bg="#4CAF50", fg="white",
+                                        font=("Arial", 12), command=calculate_price)
+            purchase_button.pack(pady=15)
+            progress_label = tk.Label(ticket_window, text="", font=("Arial", 10), bg="#f0f4f7")
+            progress_label.pack()
+            progress_bar = ttk.Progressbar(ticket_window, mode="indeterminate", length=200)
 
-        manage_window = tk.Toplevel(root)
-        manage_window.title("Manage Tickets")
-        manage_window.geometry("400x300")
-        manage_window.configure(bg="#f0f4f7")
+        manage_window = sessions.open_window("Manage Tickets", "400x300")
 
         tk.Label(manage_window, text="Manage Tickets", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
 
         tk.Button(manage_window, text="Buy Ticket", bg="#4CAF50", fg="white", font=("Arial", 12), 
                   command=buy_ticket).pack(pady=20)
+        tk.Button(manage_window, text="My Tickets", bg="#2196F3", fg="white", font=("Arial", 12), 
+                  command=lambda: my_tickets_screen(user)).pack(pady=10)
+
+    def my_tickets_screen(user):
+        page = [0]
+
+        def show_page():
+            tickets, has_more = service.my_tickets(user, page[0])
+            tickets_listbox.delete(0, tk.END)
+            for ticket_type, visit_date, num_people, price in tickets:
+                tickets_listbox.insert(tk.END, f"{visit_date.strftime('%m/%d/%Y')}  {ticket_type} x{num_people}  "
+                                               f"{price:.2f} USD")
+            if not tickets:
+                tickets_listbox.insert(tk.END, "No tickets purchased yet.")
+            page_label.config(text=f"Page {page[0] + 1}")
+            prev_button.config(state=tk.NORMAL if page[0] > 0 else tk.DISABLED)
+            next_button.config(state=tk.NORMAL if has_more else tk.DISABLED)
+
+        def change_page(step):
+            page[0] += step
+            show_page()
+
+        tickets_window = sessions.open_window("My Tickets", "500x400")
+
+        tk.Label(tickets_window, text="My Tickets", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
+        tickets_listbox = tk.Listbox(tickets_window, width=60, height=10, font=("Arial", 11))
+        tickets_listbox.pack(pady=5)
+
+        nav_frame = tk.Frame(tickets_window, bg="#f0f4f7")
+        nav_frame.pack(pady=10)
+        prev_button = tk.Button(nav_frame, text="Previous", font=("Arial", 11), command=lambda: change_page(-1))
+        prev_button.pack(side=tk.LEFT, padx=10)
+        page_label = tk.Label(nav_frame, text="", font=("Arial", 11), bg="#f0f4f7")
+        page_label.pack(side=tk.LEFT)
+        next_button = tk.Button(nav_frame, text="Next", font=("Arial", 11), command=lambda: change_page(1))
+        next_button.pack(side=tk.LEFT, padx=10)
+
+        show_page()
+
+    def account_management():
+        # Each action looks the account up again: an earlier action in this window may have changed it
+        def view_account_details():
+            user = sessions.user
+            view_window = sessions.open_window("View Account Details", "400x300")
+
+            tk.Label(view_window, text="Account Details", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
+            tk.Label(view_window, text=f"Name: {user.name}", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+            tk.Label(view_window, text=f"Email: {user.email}", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+
+        def modify_account():
+            def modify():
+                new_name = name_entry.get()
+                new_email = email_entry.get()
+                new_password = password_entry.get()
+                success, message = system.modify_user(sessions.user, new_name, new_email, new_password)
+                if success:
+                    messagebox.showinfo("Success", message)
+                    modify_window.destroy()
+                    sessions.show("dashboard")  # Refresh the greeting with the new name
+                else:
+                    messagebox.showerror("Error", message)
+
+            user = sessions.user
+            modify_window = sessions.open_window("Modify Account", "400x400")
+
+            tk.Label(modify_window, text="Modify Account", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
+
+            tk.Label(modify_window, text="New Name:", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+            name_entry = tk.Entry(modify_window, width=30)
+            name_entry.insert(0, user.name)
+            name_entry.pack()
+
+            tk.Label(modify_window, text="New Email:", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+            email_entry = tk.Entry(modify_window, width=30)
+            email_entry.insert(0, user.email)
+            email_entry.pack()
 
-    def user_dashboard(user):
-        def account_management():
-            def view_account_details():
-                view_window = tk.Toplevel(dashboard)
-                view_window.title("View Account Details")
-                view_window.geometry("400x300")
-                view_window.configure(bg="#f0f4f7")
-                
-                tk.Label(view_window, text="Account Details", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
-                tk.Label(view_window, text=f"Name: {user.name}", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
-                tk.Label(view_window, text=f"Email: {user.email}", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
-                tk.Label(view_window, text=f"Password: {user.password}", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
-
-            def modify_account():
-                def modify():
-                    new_name = name_entry.get()
-                    new_email = email_entry.get()
-                    new_password = password_entry.get()
-                    success, message = system.modify_user(user, new_name, new_email, new_password)
-                    if success:
-                        messagebox.showinfo("Success", message)
-                        modify_window.destroy()
-                    else:
-                        messagebox.showerror("Error", message)
-
-                modify_window = tk.Toplevel(dashboard)
-                modify_window.title("Modify Account")
-                modify_window.geometry("400x400")
-                modify_window.configure(bg="#f0f4f7")
-
-                tk.Label(modify_window, text="Modify Account", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
-                
-                tk.Label(modify_window, text="New Name:", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
-                name_entry = tk.Entry(modify_window, width=30)
-                name_entry.insert(0, user.name)
-                name_entry.pack()
-
-                tk.Label(modify_window, text="New Email:", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
-                email_entry = tk.Entry(modify_window, width=30)
-                email_entry.insert(0, user.email)
-                email_entry.pack()
-
-                tk.Label(modify_window, text="New Password:", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
-                password_entry = tk.Entry(modify_window, show="*", width=30)
-                password_entry.insert(0, user.password)
-                password_entry.pack()
-
-                tk.Button(modify_window, text="Modify Account", bg="#4CAF50", fg="white", font=("Arial", 12), 
-                          command=modify).pack(pady=15)
-
-            def delete_account():
-                confirm = messagebox.askyesno("Delete Account", "Are you sure you want to delete your account?")
-                if confirm:
-                    success, message = system.delete_user(user)
-                    if success:
-                        messagebox.showinfo("Success", message)
-                        dashboard.destroy()  # Destroy the current dashboard window
-                        main_screen(system)  # Call the main screen function to show the main screen
-
-
-            dashboard = tk.Toplevel()
-            dashboard.title(f"Welcome {user.name}")
-            dashboard.geometry("500x400")
-            dashboard.configure(bg="#ffffff")
-
-            tk.Button(dashboard, text="View Account Details", bg="#4CAF50", fg="white", font=("Arial", 12), 
-                      command=view_account_details).pack(pady=10)
-            tk.Button(dashboard, text="Modify Account", bg="#2196F3", fg="white", font=("Arial", 12), 
-                      command=modify_account).pack(pady=10)
-            tk.Button(dashboard, text="Delete Account", bg="#FF5722", fg="white", font=("Arial", 12), 
-                      command=delete_account).pack(pady=10)
-
-        dashboard = tk.Tk()
-        dashboard.title(f"Welcome {user.name}")
-        dashboard.geometry("500x400")
-        dashboard.configure(bg="#ffffff")
-
-        tk.Label(dashboard, text="User Dashboard", font=("Arial", 18), bg="#ffffff").pack(pady=20)
-
-        tk.Button(dashboard, text="Account Management", bg="#2196F3", fg="white", font=("Arial", 12), 
+            tk.Label(modify_window, text="New Password (blank to keep):", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+            password_entry = tk.Entry(modify_window, show="*", width=30)
+            password_entry.pack()
+
+            tk.Button(modify_window, text="Modify Account", bg="#4CAF50", fg="white", font=("Arial", 12), 
+                      command=modify).pack(pady=15)
+
+        def delete_account():
+            confirm = messagebox.askyesno("Delete Account", "Are you sure you want to delete your account?")
+            if confirm:
+                success, message = system.delete_user(sessions.user)
+                if success:
+                    messagebox.showinfo("Success", message)
+                    sessions.logout()  # Back to the cached main screen
+                else:
+                    messagebox.showerror("Error", message)
+
+        account_window = sessions.open_window(f"Welcome {sessions.user.name}", "500x400", bg="#ffffff")
+
+        tk.Button(account_window, text="View Account Details", bg="#4CAF50", fg="white", font=("Arial", 12), 
+                  command=view_account_details).pack(pady=10)
+        tk.Button(account_window, text="Modify Account", bg="#2196F3", fg="white", font=("Arial", 12), 
+                  command=modify_account).pack(pady=10)
+        tk.Button(account_window, text="Delete Account", bg="#FF5722", fg="white", font=("Arial", 12), 
+                  command=delete_account).pack(pady=10)
+
+    def build_dashboard(frame):
+        frame.configure(bg="#ffffff")
+        tk.Label(frame, text="User Dashboard", font=("Arial", 18), bg="#ffffff").pack(pady=20)
+        welcome_label = tk.Label(frame, text="", font=("Arial", 12), bg="#ffffff")
+        welcome_label.pack()
+
+        tk.Button(frame, text="Account Management", bg="#2196F3", fg="white", font=("Arial", 12), 
                   command=account_management).pack(pady=10)
 
-        tk.Button(dashboard, text="Manage Tickets", bg="#4CAF50", fg="white", font=("Arial", 12), 
-                  command=lambda: manage_tickets_screen(user)).pack(pady=20)
+        tk.Button(frame, text="Manage Tickets", bg="#4CAF50", fg="white", font=("Arial", 12), 
+                  command=lambda: manage_tickets_screen(sessions.user)).pack(pady=20)
+
+        tk.Button(frame, text="Log Out", bg="#9E9E9E", fg="white", font=("Arial", 12), 
+                  command=sessions.logout).pack(pady=10)
+
+        def refresh():
+            user = sessions.user
+            root.title(f"Welcome {user.name}")
+            welcome_label.config(text=f"Logged in as {user.name} ({user.email})")
+        return refresh
 
     def admin_dashboard():
         def view_ticket_sales():
-            date = date_entry.get()
-            if date:
-                sales = system.get_ticket_sales(date)
-                messagebox.showinfo("Ticket Sales", f"Total tickets sold on {date}: {sales}")
+            success, report = service.sales_report(date_entry.get(), end_date_entry.get())
+            if success:
+                messagebox.showinfo("Ticket Sales", report)
             else:
-                messagebox.showerror("Error", "Please enter a valid date.")
+                messagebox.showerror("Error", report)
 
         def update_discount():
-            ticket_type = ticket_type_combobox.get()
-            discount_percentage = discount_entry.get()
-            if ticket_type and discount_percentage:
-                try:
-                    discount_percentage = float(discount_percentage)
-                    system.set_discount(ticket_type, discount_percentage)
-                    messagebox.showinfo("Success", f"Discount for {ticket_type} updated to {discount_percentage}%")
-                except ValueError:
-                    messagebox.showerror("Error", "Invalid discount value.")
+            success, message = service.set_discount(ticket_type_combobox.get(), discount_entry.get())
+            if success:
+                messagebox.showinfo("Success", message)
+            else:
+                messagebox.showerror("Error", message)
+
+        def update_capacity():
+            success, message = service.set_capacity(ticket_type_combobox.get(), capacity_entry.get())
+            if success:
+                messagebox.showinfo("Success", message)
             else:
-                messagebox.showerror("Error", "Please fill out all fields.")
+                messagebox.showerror("Error", message)
 
         admin_window = tk.Toplevel(root)
         admin_window.title("Admin Dashboard")
-        admin_window.geometry("400x400")
+        admin_window.geometry("400x600")
         admin_window.configure(bg="#f0f4f7")
 
         tk.Label(admin_window, text="Admin Dashboard", font=("Arial", 16), bg="#f0f4f7").pack(pady=10)
@@ -492,6 +2608,9 @@ def main_screen(system):
         tk.Label(admin_window, text="View Ticket Sales (Date: MM/DD/YYYY):", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
         date_entry = tk.Entry(admin_window, width=30)
         date_entry.pack()
+        tk.Label(admin_window, text="End Date (optional, for a range):", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+        end_date_entry = tk.Entry(admin_window, width=30)
+        end_date_entry.pack()
         tk.Button(admin_window, text="View Sales", bg="#4CAF50", fg="white", font=("Arial", 12), 
                   command=view_ticket_sales).pack(pady=10)
 
@@ -505,24 +2624,891 @@ def main_screen(system):
         tk.Button(admin_window, text="Update Discount", bg="#4CAF50", fg="white", font=("Arial", 12), 
                   command=update_discount).pack(pady=10)
 
+        # Daily Capacity
+        tk.Label(admin_window, text="Daily Capacity (blank for unlimited):", font=("Arial", 12), bg="#f0f4f7").pack(pady=5)
+        capacity_entry = tk.Entry(admin_window, width=30)
+        capacity_entry.pack()
+        tk.Button(admin_window, text="Update Capacity", bg="#4CAF50", fg="white", font=("Arial", 12), 
+                  command=update_capacity).pack(pady=10)
+
+    def build_main(frame):
+        frame.configure(bg="#f0f4f7")
+        tk.Label(frame, text="Theme Park Management System", font=("Arial", 20), bg="#f0f4f7").pack(pady=20)
+
+        tk.Button(frame, text="Create Account", bg="#4CAF50", fg="white", font=("Arial", 12), command=create_account_screen).pack(pady=10)
+        tk.Button(frame, text="User Login", bg="#2196F3", fg="white", font=("Arial", 12), command=user_login_screen).pack(pady=10)
+        tk.Button(frame, text="Admin Login", bg="#FF5722", fg="white", font=("Arial", 12), command=admin_login_screen).pack(pady=10)
+        return lambda: root.title("Theme Park Management System")
+
+    # The only Tk root; logging in and out swaps frames inside it
     root = tk.Tk()
-    root.title("Theme Park Management System")
     root.geometry("600x400")
     root.configure(bg="#f0f4f7")
 
-    tk.Label(root, text="Theme Park Management System", font=("Arial", 20), bg="#f0f4f7").pack(pady=20)
+    status_label = tk.Label(root, text="", font=("Arial", 10), bg="#f0f4f7")
+    status_label.pack(side="bottom", pady=5)
+
+    sessions = SessionManager(root, system)
+    sessions.register("main", build_main)
+    sessions.register("dashboard", build_dashboard)
+    sessions.show("main")
+
+    # Startup timing: the first idle callback runs once the window is on screen
+    def report_first_window():
+        if started_at is not None:
+            print(f"Time to first window: {time.perf_counter() - started_at:.3f}s")
 
-    tk.Button(root, text="Create Account", bg="#4CAF50", fg="white", font=("Arial", 12), command=create_account_screen).pack(pady=10)
-    tk.Button(root, text="User Login", bg="#2196F3", fg="white", font=("Arial", 12), command=user_login_screen).pack(pady=10)
-    tk.Button(root, text="Admin Login", bg="#FF5722", fg="white", font=("Arial", 12), command=admin_login_screen).pack(pady=10)
+    load_errors = []
 
+    def load_data_in_background():
+        try:
+            system.load_data()
+        except Exception as e:
+            load_errors.append(e)
+
+    def check_ready():
+        if load_errors:
+            status_label.config(text=f"Failed to load park data: {load_errors[0]}")
+        elif system.ready.is_set():
+            status_label.config(text=f"Ready: {system.user_count()} accounts loaded")
+            if started_at is not None:
+                print(f"Time to ready: {time.perf_counter() - started_at:.3f}s")
+        else:
+            root.after(50, check_ready)
+
+    root.after(0, report_first_window)
+    if load_in_background:
+        # Show the window right away and unpickle the data off the Tk thread
+        status_label.config(text="Loading park data...")
+        threading.Thread(target=load_data_in_background, daemon=True).start()
+        root.after(50, check_ready)
+
+    if not mainloop:
+        return sessions
     root.mainloop()
 
 
+# Benchmark: login and lookup latency as the user base grows
+def benchmark_user_lookup(sizes=(1000, 10000, 100000, 1000000), lookups=10000, scans=20):
+    print(f"{'users':>10} {'login (us)':>12} {'email check (us)':>18} {'id lookup (us)':>16} {'linear scan (us)':>18}")
+    for size in sizes:
+        # A one-iteration hash keeps the timing about the index, not PBKDF2
+        bench = System(password_iterations=1)
+        password_hash = hash_password("secret", 1)
+        bench.users = [User(i + 1, f"User {i}", f"user{i}@example.com", password_hash) for i in range(size)]
+        bench.rebuild_indexes()
+        emails = [f"user{random.randrange(size)}@example.com" for _ in range(lookups)]
+        user_ids = [random.randrange(size) + 1 for _ in range(lookups)]
+
+        start = time.perf_counter()
+        for email in emails:
+            bench.validate_user_login(email, "secret")
+        login_us = (time.perf_counter() - start) / lookups * 1e6
+
+        start = time.perf_counter()
+        for email in emails:
+            bench.get_user_by_email(email)
+        email_us = (time.perf_counter() - start) / lookups * 1e6
+
+        start = time.perf_counter()
+        for user_id in user_ids:
+            bench.get_user(user_id)
+        id_us = (time.perf_counter() - start) / lookups * 1e6
+
+        # The old any(...) scan, for reference
+        start = time.perf_counter()
+        for email in emails[:scans]:
+            any(u.email == email for u in bench.users)
+        scan_us = (time.perf_counter() - start) / scans * 1e6
+
+        print(f"{size:>10} {login_us:>12.2f} {email_us:>18.2f} {id_us:>16.2f} {scan_us:>18.2f}")
+
+
+# Import group and school bookings from a CSV file with email, ticket_type, num_people and visit_date columns
+def import_bookings(system, path, batch_size=1000):
+    with open(path, newline='') as f:
+        recorded, errors = TicketService(system).bulk_purchase(csv.DictReader(f), batch_size)
+    for row_number, message in errors:
+        print(f"Row {row_number}: {message}")
+    print(f"Recorded {recorded} bookings, {len(errors)} rejected")
+
+
+# Write rows to path through a temp file, chunk by chunk, so a run that dies midway leaves no partial report
+def write_csv(path, header, rows, chunk_size=10000):
+    with open(path + '.tmp', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            writer.writerows(chunk)
+    os.replace(path + '.tmp', path)
+
+
+# Export sales, revenue and user reports as CSV for finance. Incremental runs cover only tickets and
+# accounts added since the last run, tracked in export_state.json: the ledger is append-only and
+# user IDs are never reused, so a row count and the last user ID are exact cursors.
+def export_reports(system, out_dir, incremental=True, chunk_size=10000):
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, 'export_state.json')
+    state = {"ledger_rows": 0, "last_user_id": 0, "exported_at": None}
+    if incremental:
+        try:
+            with open(state_path) as f:
+                state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+    with system.lock:
+        start_row, stop_row = state["ledger_rows"], len(system.ticket_ledger)
+        last_user_id = system.last_user_id
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    def report(name):
+        return os.path.join(out_dir, f"{stamp}-{name}.csv")
+
+    # One pass over the new ledger rows streams tickets.csv and folds the small per-day and per-type totals
+    daily = {}  # (visit_date, ticket_type) -> [tickets, revenue]
+    by_type = {}  # ticket_type -> [orders, tickets, revenue]
+
+    def tickets():
+        for user_id, ticket_type, visit_date, num_people, price in system.ticket_ledger.rows(start_row, stop_row):
+            day = daily.setdefault((visit_date, ticket_type), [0, 0.0])
+            day[0] += num_people
+            day[1] += price
+            totals = by_type.setdefault(ticket_type, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += num_people
+            totals[2] += price
+            yield user_id, ticket_type, visit_date.strftime("%m/%d/%Y"), num_people, f"{price:.2f}"
+    write_csv(report("tickets"), ("user_id", "ticket_type", "visit_date", "num_people", "price"), tickets(), chunk_size)
+    write_csv(report("daily_sales"), ("visit_date", "ticket_type", "tickets", "revenue"),
+              ((date.strftime("%m/%d/%Y"), ticket_type, num_tickets, f"{revenue:.2f}")
+               for (date, ticket_type), (num_tickets, revenue) in sorted(daily.items())), chunk_size)
+    write_csv(report("revenue_by_type"), ("ticket_type", "orders", "tickets", "revenue"),
+              ((ticket_type, orders, num_tickets, f"{revenue:.2f}")
+               for ticket_type, (orders, num_tickets, revenue) in sorted(by_type.items())), chunk_size)
+
+    # New accounts only; passwords never leave the system
+    new_users = 0
+
+    def users():
+        nonlocal new_users
+        for user in system.users:
+            if user is not None and state["last_user_id"] < user.user_id <= last_user_id:
+                new_users += 1
+                yield user.user_id, user.name, user.email
+    write_csv(report("users"), ("user_id", "name", "email"), users(), chunk_size)
+
+    write_csv(report("summary"), ("metric", "value"), iter([
+        ("since", state["exported_at"] or "beginning"),
+        ("total_users", system.user_count()),
+        ("new_users", new_users),
+        ("orders", stop_row - start_row),
+        ("tickets", sum(totals[1] for totals in by_type.values())),
+        ("revenue", f"{sum(totals[2] for totals in by_type.values()):.2f}"),
+    ]))
+
+    # The cursor moves only once every report is in place, so a failed run is simply repeated
+    state = {"ledger_rows": stop_row, "last_user_id": last_user_id,
+             "exported_at": datetime.datetime.now().isoformat(timespec="seconds")}
+    dump_json(state_path + '.tmp', state)
+    os.replace(state_path + '.tmp', state_path)
+    print(f"Exported {stop_row - start_row} orders and {new_users} new users to {out_dir} ({stamp}-*.csv)")
+
+
+# One read-only System over a sharded data directory, for reports: the main System's data plus every shard's
+# users. An account caught mid-move between shards is counted once.
+def load_shards_read_only(data_dir='data/shards', journal_mode=True):
+    system = System(FileStorage(os.path.join(data_dir, 'main'), journal_mode=journal_mode, read_only=True))
+    system.load_data()
+    for name in sorted(os.listdir(data_dir)):
+        if not name.startswith('shard-'):
+            continue
+        shard = System(FileStorage(os.path.join(data_dir, name), journal_mode=journal_mode, read_only=True))
+        shard.load_data()
+        for user in shard.users:
+            if user is not None and user.user_id not in system.users_by_id:
+                system.users.append(user)
+                system.users_by_id[user.user_id] = user
+        system.last_user_id = max(system.last_user_id, shard.last_user_id)
+    system.rebuild_indexes()
+    return system
+
+
+# Open the configured storage engine
+def create_system(storage="pickle", journal_mode=False, password_iterations=None, read_only=False, shards=None):
+    if shards:
+        return ShardedSystem(shards, journal_mode=journal_mode, password_iterations=password_iterations)
+    if storage == "sqlite":
+        return System(SQLiteStorage(), password_iterations)  # WAL readers never disturb the writer
+    return System(FileStorage(journal_mode=journal_mode, read_only=read_only), password_iterations)
+
+
+# Latency percentile over an already sorted list
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Load test: drive signups, logins and purchases through TicketService at a fixed arrival rate
+def load_test(rate=200, duration=10, workers=8, seed_users=1000, journal_mode=False, metrics=None):
+    with tempfile.TemporaryDirectory() as data_dir:
+        system = System(FileStorage(data_dir, journal_mode=journal_mode))
+        if metrics is not None:
+            instrument(system, metrics)
+        system.load_data()
+        password_hash = hash_password("secret")
+        for i in range(seed_users):
+            system.apply_record(("create_user", i + 1, f"User {i}", f"user{i}@example.com", password_hash))
+        system.store_data()
+        service = TicketService(system)
+        card = {"card_number": "4111111111111111", "expiry_date": "12/30", "cvv": "123"}
+        visit_date = (datetime.date.today() + datetime.timedelta(days=30)).strftime("%m/%d/%Y")
+        signups = iter(range(seed_users, 10 ** 9))
+        latencies = {"signup": [], "login": [], "purchase": []}
+
+        def run(op, submitted_at):
+            if op == "signup":
+                i = next(signups)
+                service.signup(f"User {i}", f"user{i}@example.com", "secret", "secret")
+            elif op == "login":
+                service.login(f"user{random.randrange(seed_users)}@example.com", "secret")
+            else:
+                success, user = service.login(f"user{random.randrange(seed_users)}@example.com", "secret")
+                service.purchase(user, random.choice(ticket_types)[0], random.randint(1, 6), visit_date,
+                                 "Credit Card", card)
+            latencies[op].append(time.perf_counter() - submitted_at)
+
+        # Open loop: requests arrive on schedule whether or not earlier ones have finished
+        ops = ["signup"] * 2 + ["login"] * 5 + ["purchase"] * 3
+        total = int(rate * duration)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for n in range(total):
+                scheduled = start + n / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(run, random.choice(ops), time.perf_counter())
+        elapsed = time.perf_counter() - start
+
+    print(f"{total} requests at {rate}/s target with {workers} workers in {elapsed:.2f}s "
+          f"({total / elapsed:.1f} req/s)")
+    print(f"{'operation':>10} {'count':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    for op, values in latencies.items():
+        values.sort()
+        print(f"{op:>10} {len(values):>8} {percentile(values, 50) * 1000:>10.2f} "
+              f"{percentile(values, 95) * 1000:>10.2f} {percentile(values, 99) * 1000:>10.2f}")
+
+
+# Stress test: many parallel buyers competing for a capped ticket type on one day
+def stress_test_inventory(buyers=5000, workers=16, capacity=500, release_rate=0.2):
+    with tempfile.TemporaryDirectory() as data_dir:
+        system = System(FileStorage(data_dir, journal_mode=True))
+        system.load_data()
+        for i in range(100):
+            system.apply_record(("create_user", i + 1, f"User {i}", f"user{i}@example.com", "secret"))
+        system.store_data()
+        system.set_capacity("VIP Experience Pass", capacity)
+        visit_day = datetime.date(2025, 7, 1)
+        outcomes = {"confirmed": 0, "released": 0, "rejected": 0}
+        confirmed_tickets = []
+        counter_lock = threading.Lock()
+
+        def buyer(i):
+            num_people = random.randint(1, 4)
+            success, reservation_id = system.inventory.reserve(visit_day, "VIP Experience Pass", num_people)
+            if not success:
+                outcome = "rejected"
+            elif random.random() < release_rate:
+                # Abandoned checkout or declined payment
+                system.inventory.release(reservation_id)
+                outcome = "released"
+            else:
+                system.inventory.confirm(reservation_id, system.get_user(i % 100 + 1), num_people * 550.0)
+                outcome = "confirmed"
+                confirmed_tickets.append(num_people)
+            with counter_lock:
+                outcomes[outcome] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(buyer, range(buyers)))
+        elapsed = time.perf_counter() - start
+
+        sold = system.get_ticket_sales(visit_day)
+        reloaded = System(FileStorage(data_dir))
+        reloaded.load_data()
+        print(f"{buyers} buyers on {workers} threads in {elapsed:.2f}s ({buyers / elapsed:.0f} reservations/s)")
+        print(f"confirmed {outcomes['confirmed']}, released {outcomes['released']}, rejected {outcomes['rejected']}")
+        print(f"sold {sold} of {capacity}, {reloaded.get_ticket_sales(visit_day)} after reload, "
+              f"{len(system.inventory.held)} holds left open")
+        assert sold <= capacity, "oversold"
+        assert sold == sum(confirmed_tickets) == reloaded.get_ticket_sales(visit_day)
+        assert not system.inventory.held
+
+
+# HTTP load test server: seeds accounts in a temporary data directory and serves them until killed
+def api_load_test_server(conn, data_dir, seed_users, workers, payment_latency):
+    system = System(FileStorage(data_dir, journal_mode=True), password_iterations=1000)
+    system.load_data()
+    password_hash = hash_password("secret", 1000)
+    for i in range(seed_users):
+        system.apply_record(("create_user", i + 1, f"User {i}", f"user{i}@example.com", password_hash))
+    system.store_data()
+    gateway = FakePaymentGateway(payment_latency) if payment_latency else None
+    server = ApiServer(("127.0.0.1", 0), TicketService(system, gateway=gateway), workers)
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+# HTTP load test: keep-alive clients against a server process, reporting requests per second and tail latency
+def api_load_test(connections=16, duration=10, workers=32, seed_users=1000, payment_latency=0.0):
+    with tempfile.TemporaryDirectory() as data_dir:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        server = multiprocessing.Process(target=api_load_test_server, daemon=True,
+                                         args=(child_conn, data_dir, seed_users, workers, payment_latency))
+        server.start()
+        port = parent_conn.recv()
+        card = {"card_number": "4111111111111111", "expiry_date": "12/30", "cvv": "123"}
+        visit_date = (datetime.date.today() + datetime.timedelta(days=30)).strftime("%m/%d/%Y")
+        latencies = {"quote": [], "purchase": [], "tickets": [], "login": []}
+        errors = []
+        stop_at = time.perf_counter() + duration
+
+        def call(conn, method, path, body=None, token=None):
+            headers = {"Content-Type": "application/json"}
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = conn.getresponse()
+            payload = json.loads(response.read())
+            if response.status != 200:
+                errors.append(payload["message"])
+            return payload
+
+        def client(n):
+            # One connection per client, reused for every request
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            start = time.perf_counter()
+            token = call(conn, "POST", "/login", {"email": f"user{n % seed_users}@example.com",
+                                                  "password": "secret"}).get("token")
+            latencies["login"].append(time.perf_counter() - start)
+            while time.perf_counter() < stop_at:
+                op = random.choice(("quote", "quote", "quote", "purchase", "tickets"))
+                ticket_type = random.choice(ticket_types)[0]
+                start = time.perf_counter()
+                if op == "quote":
+                    call(conn, "GET", "/quote?" + urllib.parse.urlencode(
+                        {"ticket_type": ticket_type, "num_people": random.randint(1, 6), "visit_date": visit_date}))
+                elif op == "purchase":
+                    call(conn, "POST", "/purchase", {"ticket_type": ticket_type, "num_people": random.randint(1, 4),
+                                                     "visit_date": visit_date, "payment_method": "Credit Card",
+                                                     "payment_details": card}, token)
+                else:
+                    call(conn, "GET", "/tickets", token=token)
+                latencies[op].append(time.perf_counter() - start)
+            conn.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(client, range(connections)))
+        elapsed = time.perf_counter() - start
+        server.kill()
+        server.join()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} requests over {connections} keep-alive connections in {elapsed:.2f}s "
+          f"({total / elapsed:.1f} req/s), {len(errors)} rejected by business rules")
+    for message, count in collections.Counter(errors).most_common(3):
+        print(f"  {count:>6} x {message}")
+    print(f"{'operation':>10} {'count':>8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    for op, values in latencies.items():
+        values.sort()
+        print(f"{op:>10} {len(values):>8} {percentile(values, 50) * 1000:>10.2f} "
+              f"{percentile(values, 95) * 1000:>10.2f} {percentile(values, 99) * 1000:>10.2f}")
+
+
+# Fault injection writer: signs up users, each with one ticket, reporting every durable commit to the parent
+def fault_injection_worker(conn, data_dir, journal_mode):
+    try:
+        system = System(FileStorage(data_dir, journal_mode=journal_mode, compact_threshold=25), password_iterations=1)
+        system.load_data()
+    except Exception as e:
+        conn.send(repr(e))
+        return
+    conn.send(system.user_count())
+    visit_day = datetime.date(2025, 7, 1)
+    while True:
+        n = system.last_user_id
+        # The user and their ticket go to storage together, so a snapshot has both or neither
+        with system.batch():
+            system.create_user(f"User {n}", f"user{n}@example.com", "secret")
+            system.record_purchase(system.get_user_by_email(f"user{n}@example.com"), "Single-Day Pass",
+                                   visit_day, 1, 55.0)
+        conn.send(system.user_count())
+
+
+# Fault injection: SIGKILL the writer at random points, then check the data still loads,
+# nothing acknowledged was lost and users, tickets and sales agree
+def fault_injection_test(rounds=40, corrupt_every=4):
+    failures = 0
+    with tempfile.TemporaryDirectory() as data_dir:
+        acknowledged = 0
+        for round_number in range(rounds):
+            journal_mode = round_number % 2 == 1
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=fault_injection_worker, daemon=True,
+                                              args=(child_conn, data_dir, journal_mode))
+            process.start()
+            child_conn.close()
+            started = parent_conn.recv()
+            if isinstance(started, str):
+                print(f"round {round_number}: writer could not load: {started}")
+                failures += 1
+                process.join()
+                continue
+            deadline = time.perf_counter() + random.uniform(0.01, 0.3)
+            while time.perf_counter() < deadline:
+                if parent_conn.poll(0.001):
+                    acknowledged = parent_conn.recv()
+            process.kill()
+            process.join()
+            try:
+                while parent_conn.poll():
+                    acknowledged = parent_conn.recv()
+            except (EOFError, OSError, pickle.UnpicklingError):
+                pass  # A message cut off by the kill was never acknowledged
+
+            # With a journal, even a damaged newest generation must lose nothing: load falls back and rolls forward
+            storage = FileStorage(data_dir)
+            corrupted = False
+            if journal_mode and round_number % corrupt_every == 1 and len(storage.generations()) > 1:
+                newest = storage.read_manifest(storage.generations()[0])
+                if newest is not None:
+                    with open(storage.path(newest["files"]["tickets"][0]), 'r+b') as f:
+                        f.write(b"\0")
+                    corrupted = True
+
+            system = System(storage, password_iterations=1)
+            try:
+                system.load_data()
+            except Exception as e:
+                print(f"round {round_number}: load failed: {e!r}")
+                failures += 1
+                break
+            users = system.user_count()
+            tickets = len(system.ticket_ledger)
+            sold = sum(num_tickets for date, ticket_type, num_tickets in system.ticket_sales.rows())
+            ok = users == tickets == sold and users >= acknowledged
+            failures += not ok
+            print(f"round {round_number:>3} {'journal' if journal_mode else 'snapshot':>8}"
+                  f"{' corrupted' if corrupted else '':>10} acknowledged {acknowledged:>6} users {users:>6} "
+                  f"tickets {tickets:>6} sold {sold:>6} {'ok' if ok else 'FAILED'}")
+    print(f"{rounds} kills, {failures} failures")
+    return failures == 0
+
+
+# Measure how long the Tk event loop stalls while slow payments are in flight
+def measure_ui_responsiveness(latency=1.0, failure_rate=0.1, payments=20, inline=False):
+    import tkinter as tk
+    with tempfile.TemporaryDirectory() as data_dir:
+        system = System(FileStorage(data_dir))
+        system.load_data()
+        system.create_user("Load Test", "load@example.com", "secret")
+        user = system.get_user_by_email("load@example.com")
+        service = TicketService(system, gateway=FakePaymentGateway(latency, failure_rate))
+        card = {"card_number": "4111111111111111", "expiry_date": "12/30", "cvv": "123"}
+        visit_date = (datetime.date.today() + datetime.timedelta(days=30)).strftime("%m/%d/%Y")
+        tick = 0.01
+        lags = []
+        results = []
+        root = tk.Tk()
+        root.withdraw()
+        expected = [time.perf_counter() + tick]
+
+        # A heartbeat that should fire every 10 ms; any delay is time the UI could not respond
+        def heartbeat():
+            now = time.perf_counter()
+            lags.append(max(0.0, now - expected[0]))
+            expected[0] = now + tick
+            if len(results) < payments:
+                root.after(int(tick * 1000), heartbeat)
+            else:
+                root.quit()
+
+        def check(future):
+            if future.done():
+                results.append(future.result())
+            else:
+                root.after(50, check, future)
+
+        def start_payments():
+            for _ in range(payments):
+                args = (user, "Single-Day Pass", "2", visit_date, "Credit Card", card)
+                if inline:
+                    results.append(service.purchase(*args))  # The old way: block inside the callback
+                else:
+                    root.after(50, check, service.purchase_async(*args))
+
+        start = time.perf_counter()
+        root.after(int(tick * 1000), heartbeat)
+        root.after(20, start_payments)
+        root.mainloop()
+        elapsed = time.perf_counter() - start
+        root.destroy()
+
+    lags.sort()
+    approved = sum(1 for success, _ in results if success)
+    print(f"{'inline' if inline else 'async'} payments: {payments} at {latency:.2f}s latency, "
+          f"{approved} approved, finished in {elapsed:.2f}s")
+    print(f"event loop lag p50 {percentile(lags, 50) * 1000:.1f} ms, p99 {percentile(lags, 99) * 1000:.1f} ms, "
+          f"max {lags[-1] * 1000:.1f} ms")
+
+
+# Soak test: log in and out through one SessionManager and check memory, Tk objects and latency stay flat
+def soak_test_sessions(logins=10000, warmup=500, users=50):
+    import tkinter as tk
+    from tkinter import messagebox
+    with tempfile.TemporaryDirectory() as data_dir:
+        system = System(FileStorage(data_dir), password_iterations=1)
+        system.load_data()
+        with system.batch():
+            for i in range(users):
+                system.create_user(f"User {i}", f"user{i}@example.com", "secret")
+        sessions = main_screen(system, mainloop=False)
+        root = sessions.root
+        root.update()
+
+        def button(parent, text):
+            return next(child for child in parent.winfo_children()
+                        if isinstance(child, tk.Button) and child.cget("text") == text)
+
+        def log_in(email):
+            # Through the real screens: the main frame's User Login button, then the login window's form
+            before = set(root.winfo_children())
+            button(sessions.frames["main"][0], "User Login").invoke()
+            login_window = next(child for child in root.winfo_children()
+                                if isinstance(child, tk.Toplevel) and child not in before)
+            email_entry, password_entry = [child for child in login_window.winfo_children()
+                                           if isinstance(child, tk.Entry)]
+            email_entry.insert(0, email)
+            password_entry.insert(0, "secret")
+            button(login_window, "Login").invoke()
+            return not login_window.winfo_exists()
+
+        def tk_objects():
+            # Widgets under the root and Tcl commands, which leak when callbacks outlive their widgets
+            widgets, pending = 0, [root]
+            while pending:
+                children = pending.pop().winfo_children()
+                widgets += len(children)
+                pending.extend(children)
+            return widgets, len(root.tk.splitlist(root.tk.call("info", "commands")))
+
+        # Message boxes are modal, so record them instead of waiting for someone to click OK
+        errors = []
+        showinfo, showerror = messagebox.showinfo, messagebox.showerror
+        messagebox.showinfo = lambda title, message, **options: None
+        messagebox.showerror = lambda title, message, **options: errors.append(message)
+        latencies = []
+        failed_logins = 0
+        tracemalloc.start()
+        try:
+            for n in range(logins):
+                start = time.perf_counter()
+                user = system.get_user_by_email(f"user{n % users}@example.com")
+                if not log_in(user.email) or sessions.user_id != user.user_id or sessions.current != "dashboard":
+                    failed_logins += 1
+                    continue
+                sessions.open_window("Manage Tickets", "400x300")  # A session window that logout has to close
+                root.update()
+                button(sessions.frames["dashboard"][0], "Log Out").invoke()
+                root.update()
+                latencies.append(time.perf_counter() - start)
+                if n + 1 == warmup:
+                    baseline_memory = tracemalloc.get_traced_memory()[0]
+                    baseline_objects = tk_objects()
+        finally:
+            messagebox.showinfo, messagebox.showerror = showinfo, showerror
+            final_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            final_objects = tk_objects()
+            root.destroy()
+        if failed_logins:
+            print(f"FAILED: {failed_logins} of {logins} logins did not reach the dashboard ({errors[:1]})")
+            return False
+
+    window = min(1000, (logins - warmup) // 2)
+    early = sorted(latencies[warmup:warmup + window])
+    late = sorted(latencies[-window:])
+    growth = (final_memory - baseline_memory) / 2**20
+    print(f"{logins} logins; after {warmup} warm-up logins memory grew {growth:.2f} MB, "
+          f"widgets/Tcl commands {baseline_objects} -> {final_objects}")
+    print(f"login+logout p50 {percentile(early, 50) * 1000:.2f} ms early, {percentile(late, 50) * 1000:.2f} ms late; "
+          f"p99 {percentile(early, 99) * 1000:.2f} ms early, {percentile(late, 99) * 1000:.2f} ms late")
+    flat = (growth < 1.0 and final_objects == baseline_objects
+            and percentile(late, 50) <= percentile(early, 50) * 1.5 + 0.0005)
+    print("flat" if flat else "FAILED: sessions are leaking")
+    return flat
+
+
+# Benchmark: logins per second on one core at each PBKDF2 cost
+def benchmark_passwords(costs=(10000, 50000, 100000, 200000, 600000), seconds=1.0):
+    print(f"{'iterations':>10} {'login (ms)':>12} {'logins/s/core':>14}")
+    for iterations in costs:
+        system = System(password_iterations=iterations)
+        system.apply_record(("create_user", 1, "User", "user@example.com", hash_password("secret", iterations)))
+        logins = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            system.validate_user_login("user@example.com", "secret")
+            logins += 1
+        elapsed = time.perf_counter() - start
+        print(f"{iterations:>10} {elapsed / logins * 1000:>12.2f} {logins / elapsed:>14.1f}")
+
+
+# Benchmark: signup and login throughput with 1 to N shard processes
+def benchmark_sharding(max_shards=None, users=2000, clients_per_shard=4, password_iterations=20000):
+    max_shards = max_shards or os.cpu_count() or 1
+    print(f"{'shards':>6} {'signups/s':>10} {'logins/s':>10}")
+    for num_shards in range(1, max_shards + 1):
+        with tempfile.TemporaryDirectory() as data_dir:
+            sharded = ShardedSystem(num_shards, data_dir, journal_mode=True, password_iterations=password_iterations)
+            clients = num_shards * clients_per_shard
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                list(executor.map(lambda i: sharded.create_user(f"User {i}", f"user{i}@example.com", "secret"),
+                                  range(users)))
+            signups = users / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                list(executor.map(lambda i: sharded.validate_user_login(f"user{i}@example.com", "secret"),
+                                  range(users)))
+            logins = users / (time.perf_counter() - start)
+
+            sharded.close()
+        print(f"{num_shards:>6} {signups:>10.1f} {logins:>10.1f}")
+
+
+# The User layout before __slots__, kept for the memory benchmark
+class LegacyUser:
+    def __init__(self, user_id, name, email, password):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.password = password
+        self.bought_tickets = []
+
+
+# Benchmark: memory and pickle cost of per-user ticket lists vs __slots__ users and the ticket ledger
+def benchmark_memory(sizes=(100000, 1000000)):
+    visit_date = datetime.date(2025, 7, 1)
+
+    def build_legacy(size):
+        users = []
+        for i in range(size):
+            user = LegacyUser(i + 1, f"User {i}", f"user{i}@example.com", "secret")
+            user.bought_tickets.append(("Single-Day Pass", visit_date, 2, 550.0))
+            users.append(user)
+        return users, None
+
+    def build_compact(size):
+        users = []
+        ledger = TicketLedger()
+        for i in range(size):
+            users.append(User(i + 1, f"User {i}", f"user{i}@example.com", "secret"))
+            ledger.add(i + 1, "Single-Day Pass", visit_date, 2, 550.0)
+        return users, ledger
+
+    print(f"{'users':>10} {'layout':>8} {'peak MB':>10} {'dump (s)':>10} {'load (s)':>10} {'pickle MB':>10}")
+    for size in sizes:
+        for layout, build in (("legacy", build_legacy), ("compact", build_compact)):
+            tracemalloc.start()
+            data = build(size)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            blob = pickle.dumps(data)
+            dump_s = time.perf_counter() - start
+            start = time.perf_counter()
+            pickle.loads(blob)
+            load_s = time.perf_counter() - start
+
+            print(f"{size:>10} {layout:>8} {peak / 2**20:>10.1f} {dump_s:>10.3f} {load_s:>10.3f} {len(blob) / 2**20:>10.1f}")
+            del data, blob
+
+
+# Benchmark: encode/decode time and file size of the user record file against pickle
+def benchmark_serialization(sizes=(10000, 100000, 1000000)):
+    print(f"{'users':>10} {'format':>8} {'write (s)':>10} {'read (s)':>10} {'MB':>8} {'one user (ms)':>14}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in sizes:
+            # Distinct salted hashes, as in real data, so pickle cannot share one string across users
+            users = [User(i + 1, f"User {i}", f"user{i}@example.com", hash_password("secret", 1)) for i in range(size)]
+            middle = size // 2
+
+            path = os.path.join(data_dir, "users.pkl")
+            start = time.perf_counter()
+            with open(path, 'wb') as f:
+                pickle.dump(users, f)
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            with open(path, 'rb') as f:
+                pickle.load(f)
+            read_s = time.perf_counter() - start
+            # Pickle has no random access: one user costs a full load
+            print(f"{size:>10} {'pickle':>8} {write_s:>10.3f} {read_s:>10.3f} {os.path.getsize(path) / 2**20:>8.1f} "
+                  f"{read_s * 1000:>14.3f}")
+
+            path = os.path.join(data_dir, "users.dat")
+            start = time.perf_counter()
+            write_record_file(path, b"USER", users)
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            with RecordFile(path, b"USER") as records:
+                list(records)
+            read_s = time.perf_counter() - start
+            start = time.perf_counter()
+            with RecordFile(path, b"USER") as records:
+                assert records[middle].user_id == middle + 1
+            one_s = time.perf_counter() - start
+            print(f"{size:>10} {'records':>8} {write_s:>10.3f} {read_s:>10.3f} {os.path.getsize(path) / 2**20:>8.1f} "
+                  f"{one_s * 1000:>14.3f}")
+            del users
+
+
 # Initialize System
-system = System()
-system.load_data()
-main_screen(system)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Theme Park Management System")
+    parser.add_argument("--benchmark-lookup", action="store_true", help="Benchmark user lookups from 1k to 1M users")
+    parser.add_argument("--benchmark-serialization", action="store_true", help="Compare the user record file with pickle at 10k, 100k and 1M users")
+    parser.add_argument("--benchmark-memory", action="store_true", help="Compare memory use of the user and ticket layouts at 100k and 1M users")
+    parser.add_argument("--load-test", action="store_true", help="Run the headless signup/login/purchase load test")
+    parser.add_argument("--rate", type=int, default=200, help="Load test arrival rate in requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="Load test duration in seconds")
+    parser.add_argument("--workers", type=int, default=8, help="Load test worker threads")
+    parser.add_argument("--fault-injection", action="store_true", help="Kill the storage writer at random points and check every snapshot still loads")
+    parser.add_argument("--serve-api", action="store_true", help="Serve the JSON ticket API instead of opening the window; "
+                        "allows 4 x --workers open connections and answers 503 past that")
+    parser.add_argument("--host", default="127.0.0.1", help="Address for --serve-api to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port for --serve-api")
+    parser.add_argument("--api-load-test", action="store_true", help="Measure HTTP API throughput and tail latency over keep-alive connections")
+    parser.add_argument("--connections", type=int, default=16, help="Client connections for --api-load-test")
+    parser.add_argument("--stress-inventory", action="store_true", help="Check that parallel buyers never oversell a capped ticket")
+    parser.add_argument("--payment-latency", type=float, help="Use the fake payment gateway with this latency in seconds")
+    parser.add_argument("--payment-failure-rate", type=float, default=0.0, help="Fraction of fake gateway payments to decline")
+    parser.add_argument("--soak-sessions", action="store_true", help="Log in and out 10k times and check memory and login latency stay flat")
+    parser.add_argument("--measure-ui", action="store_true", help="Measure event loop lag with inline and async slow payments")
+    parser.add_argument("--benchmark-passwords", action="store_true", help="Report logins per second per core at each password hashing cost")
+    parser.add_argument("--password-iterations", type=int, help="PBKDF2 iterations for new password hashes")
+    parser.add_argument("--benchmark-sharding", action="store_true", help="Measure signup and login throughput from 1 to N shard processes")
+    parser.add_argument("--shards", type=int, help="Split users across this many processes under data/shards for the "
+                        "window, --serve-api and --import-bookings; with --export, read every shard (any N); "
+                        "highest shard count for --benchmark-sharding (default: CPU count)")
+    parser.add_argument("--journal", action="store_true", help="Append changes to a journal instead of rewriting all data files")
+    parser.add_argument("--storage", choices=["pickle", "sqlite"], default="pickle", help="Storage engine for system data")
+    parser.add_argument("--lazy-start", action="store_true", help="Show the main window before the data has finished loading")
+    parser.add_argument("--import-bookings", metavar="CSV", help="Record group and school bookings from a CSV file and exit")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Bookings per storage commit when importing")
+    parser.add_argument("--export", metavar="DIR", help="Write CSV sales, revenue and user reports changed since the last export and exit")
+    parser.add_argument("--full-export", action="store_true", help="With --export, include everything rather than only changes")
+    parser.add_argument("--migrate-sqlite", action="store_true", help="Import the data/ snapshot into the SQLite database and exit")
+    parser.add_argument("--metrics", metavar="PATH", help="Time System and purchase calls and write them here on exit "
+                                                          "(JSON for a .json path, Prometheus text otherwise)")
+    parser.add_argument("--profile", metavar="PATH", help="Write a cProfile dump of the whole session, worker threads included, "
+                                                         "to this file")
+    args = parser.parse_args()
+    metrics = Metrics() if args.metrics else None
+    system = None
+    exit_code = 0  # Self-checks that find a failure exit 1 so scripts and CI notice
+    profiler = None
+    if args.profile:
+        profiler = SessionProfiler()
+        profiler.enable()
+
+    if args.benchmark_lookup:
+        benchmark_user_lookup()
+    elif args.benchmark_memory:
+        benchmark_memory()
+    elif args.benchmark_serialization:
+        benchmark_serialization()
+    elif args.load_test:
+        load_test(args.rate, args.duration, args.workers, journal_mode=args.journal, metrics=metrics)
+    elif args.benchmark_passwords:
+        benchmark_passwords()
+    elif args.benchmark_sharding:
+        benchmark_sharding(args.shards)
+    elif args.api_load_test:
+        api_load_test(args.connections, args.duration, args.workers * 4, payment_latency=args.payment_latency or 0.0)
+    elif args.fault_injection:
+        exit_code = 0 if fault_injection_test() else 1
+    elif args.stress_inventory:
+        stress_test_inventory(workers=args.workers)
+    elif args.soak_sessions:
+        exit_code = 0 if soak_test_sessions() else 1
+    elif args.measure_ui:
+        latency = args.payment_latency if args.payment_latency is not None else 0.5
+        measure_ui_responsiveness(latency, args.payment_failure_rate, payments=10, inline=True)
+        measure_ui_responsiveness(latency, args.payment_failure_rate, payments=10)
+    elif args.import_bookings:
+        system = create_system(args.storage, args.journal, args.password_iterations, shards=args.shards)
+        if metrics is not None:
+            instrument(system, metrics)
+        system.load_data()
+        import_bookings(system, args.import_bookings, args.batch_size)
+    elif args.export:
+        # Runs from cron beside the app, so it must not touch the live data directory
+        if args.shards:
+            export_reports(load_shards_read_only(), args.export, incremental=not args.full_export)
+        elif os.path.isdir('data/shards'):
+            parser.error("found sharded data in data/shards, which an export of data/ would miss; "
+                         "pass --shards to export it")
+        else:
+            system = create_system(args.storage, args.journal, args.password_iterations, read_only=True)
+            system.load_data()
+            export_reports(system, args.export, incremental=not args.full_export)
+    elif args.migrate_sqlite:
+        if args.shards or os.path.isdir('data/shards'):
+            parser.error("sharded data in data/shards cannot be migrated to SQLite; only the unsharded data/ can")
+        migrate_to_sqlite()
+    elif args.serve_api:
+        system = create_system(args.storage, args.journal, args.password_iterations, shards=args.shards)
+        if metrics is not None:
+            instrument(system, metrics)
+        system.load_data()
+        gateway = None
+        if args.payment_latency is not None:
+            gateway = FakePaymentGateway(args.payment_latency, args.payment_failure_rate)
+        serve_api(system, args.host, args.port, args.workers * 4, gateway)
+    else:
+        started_at = time.perf_counter()
+        system = create_system(args.storage, args.journal, args.password_iterations, shards=args.shards)
+        if metrics is not None:
+            instrument(system, metrics)
+        if not args.lazy_start:
+            system.load_data()
+        gateway = None
+        if args.payment_latency is not None:
+            gateway = FakePaymentGateway(args.payment_latency, args.payment_failure_rate)
+        main_screen(system, load_in_background=args.lazy_start, started_at=started_at, gateway=gateway)
+
+    if isinstance(system, ShardedSystem):
+        system.close()  # Let each shard process finish its last write and exit
+
+    if profiler is not None:
+        profiler.dump(args.profile)
+        print(f"Wrote profile to {args.profile} (view with python -m pstats {args.profile})")
+    if metrics is not None:
+        metrics.write(args.metrics)
+        print(f"Wrote metrics to {args.metrics}")
+    sys.exit(exit_code)
 
 
 # In[ ]: